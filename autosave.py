@@ -0,0 +1,85 @@
+from envparse import env
+import savegame
+import threading
+
+# player turns between autosaves. 0 turns autosaving off
+AUTOSAVE_TURNS = env.int('AUTOSAVE_TURNS', default=50)
+
+
+class Autosaver(object):
+    # saves the game without stopping it. the main thread only takes a
+    # snapshot (plain data that shares nothing with the live game), the
+    # encoding and writing happen on a background thread. if saves come in
+    # faster than they are written, only the newest waiting one is kept
+    def __init__(self, path, every=AUTOSAVE_TURNS):
+        self.path = path
+        self.every = every
+        self.turns = 0
+        # the last write that failed, for the game to report
+        self.error = None
+        self._condition = threading.Condition()
+        self._pending = None
+        self._writing = False
+        self._closed = False
+        self._thread = None
+
+    def turn(self, map, player, game_msgs, game_state):
+        # call once per player turn, saves every `every` turns
+        if not self.every:
+            return
+        self.turns += 1
+        if self.turns % self.every == 0:
+            self.save(map, player, game_msgs, game_state)
+
+    def save(self, map, player, game_msgs, game_state):
+        self.submit(savegame.snapshot(map, player, game_msgs, game_state))
+
+    def submit(self, data):
+        with self._condition:
+            if self._closed:
+                raise ValueError('Autosaver is closed.')
+            self._pending = data
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='autosave')
+                # a save cut short leaves the previous one in place, so
+                # this thread never keeps the game from quitting
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify_all()
+
+    def flush(self):
+        # wait until every submitted save is on disk
+        with self._condition:
+            while self._pending is not None or self._writing:
+                self._condition.wait()
+
+    def close(self):
+        # finish the waiting saves and stop the thread
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                data = self._pending
+                if data is None:
+                    return
+                self._pending = None
+                self._writing = True
+            try:
+                savegame.write(self.path, savegame.encode(data))
+                self.error = None
+            except Exception as e:
+                # whatever went wrong, the thread carries on with the next
+                # save rather than leaving flush() waiting forever
+                self.error = e
+            finally:
+                with self._condition:
+                    self._writing = False
+                    self._condition.notify_all()
@@ -0,0 +1,79 @@
+import unittest
+import os
+import shutil
+import struct
+import tempfile
+import savegame
+from autosave import Autosaver
+from savegame_test import new_game
+import sounds
+
+class TestAutosaver(unittest.TestCase):
+
+    def setUp(self):
+        sounds.enabled = False
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'savegame')
+        (self.map, self.player) = new_game()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_saves_every_few_turns(self):
+        autosaver = Autosaver(self.path, every=3)
+        for _ in range(2):
+            autosaver.turn(self.map, self.player, [], 'playing')
+        autosaver.flush()
+        self.assertFalse(os.path.exists(self.path))
+        autosaver.turn(self.map, self.player, [], 'playing')
+        autosaver.close()
+        (map, player, msgs, state) = savegame.load(self.path)
+        self.assertEqual(len(map._objects), len(self.map._objects))
+        self.assertEqual(os.listdir(self.directory), ['savegame'])
+
+    def test_saves_what_the_game_was_when_asked(self):
+        autosaver = Autosaver(self.path)
+        (x, y) = (self.player.x, self.player.y)
+        autosaver.save(self.map, self.player, [], 'playing')
+        # the game goes on while the save is written
+        self.player.x += 1
+        autosaver.close()
+        (map, player, msgs, state) = savegame.load(self.path)
+        self.assertEqual((player.x, player.y), (x, y))
+
+    def test_failed_writes_keep_the_old_save(self):
+        autosaver = Autosaver(self.path)
+        autosaver.save(self.map, self.player, [], 'playing')
+        autosaver.flush()
+        with open(self.path, 'rb') as file:
+            saved = file.read()
+        # a directory where the temporary file should go makes the write fail
+        os.mkdir(self.path + '.tmp')
+        autosaver.save(self.map, self.player, [], 'playing')
+        autosaver.close()
+        self.assertIsNotNone(autosaver.error)
+        with open(self.path, 'rb') as file:
+            self.assertEqual(file.read(), saved)
+
+    def test_encoding_errors_are_kept(self):
+        autosaver = Autosaver(self.path)
+        encode = savegame.encode
+
+        def broken(data):
+            raise struct.error('out of range')
+        savegame.encode = broken
+        try:
+            autosaver.save(self.map, self.player, [], 'playing')
+            autosaver.flush()
+        finally:
+            savegame.encode = encode
+        self.assertIsInstance(autosaver.error, struct.error)
+        self.assertFalse(os.path.exists(self.path))
+        # the next save still goes through
+        autosaver.save(self.map, self.player, [], 'playing')
+        autosaver.close()
+        self.assertIsNone(autosaver.error)
+        self.assertTrue(os.path.exists(self.path))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,230 @@
+import libtcodpy as libtcod
+from map import Map
+from object import Object
+from components import Fighter, AggroState
+from dungeon_generator import DungeonGenerator
+from constants import *
+import sounds
+import native
+import tiles
+import argparse
+import json
+import time
+import gc
+import sys
+
+SEED = 1234
+# each benchmark runs for at least this long (seconds)
+MIN_TIME = 0.5
+
+BENCHMARKS = []
+
+
+def benchmark(name):
+    # register a benchmark. the decorated function sets things up and
+    # returns the operation to time
+    def register(setup):
+        BENCHMARKS.append((name, setup))
+        return setup
+    return register
+
+
+def new_player():
+    fighter_component = Fighter(power_base=13, defense_base=5)
+    return Object(0, 0, tiles.player_tile, 'player', libtcod.white,
+                  blocks=True, fighter=fighter_component)
+
+
+def generated_map(seed=SEED, floor=1):
+    player = new_player()
+    map = Map(MAP_WIDTH, MAP_HEIGHT, floor)
+    map.add_object(player)
+    DungeonGenerator(seed).generate(map, player)
+    map.fov_recompute(player)
+    return (map, player)
+
+
+@benchmark('generate')
+def bench_generate():
+    player = new_player()
+
+    def op():
+        # a fresh generator each time, so every call builds the same dungeon
+        map = Map(MAP_WIDTH, MAP_HEIGHT, 1)
+        map.add_object(player)
+        DungeonGenerator(SEED).generate(map, player)
+        map.release()
+    return op
+
+
+@benchmark('set_fov_rebuild')
+def bench_set_fov_rebuild():
+    (map, player) = generated_map()
+
+    def op():
+        # drop the libtcod maps, so they are built from all the tiles again
+        map.release()
+        map.set_fov()
+    return op
+
+
+@benchmark('set_fov_changes')
+def bench_set_fov_changes():
+    (map, player) = generated_map()
+    room = map.rooms[0]
+    cells = [(x, room.y1 + 2) for x in range(room.x1 + 2, room.x2 - 1)]
+
+    def op():
+        # wall off a row of the first room and open it again, syncing the
+        # changed tiles each time
+        for blocked in [True, False]:
+            for (x, y) in cells:
+                map.tiles.set_blocked(x, y, blocked)
+            map.set_fov()
+    return op
+
+
+@benchmark('fov_recompute')
+def bench_fov_recompute():
+    (map, player) = generated_map()
+
+    def op():
+        # fov_recompute skips the work while the player stays put
+        map.invalidate_fov()
+        map.fov_recompute(player)
+    return op
+
+
+@benchmark('astar_path')
+def bench_astar_path():
+    (map, player) = generated_map()
+    (x, y) = map.rooms[-1].center()
+    return lambda: player.astar_path(map, x, y)
+
+
+@benchmark('move_astar')
+def bench_move_astar():
+    (map, player) = generated_map()
+    monster = [o for o in map._objects if o.ai is not None][-1]
+    (start_x, start_y) = (monster.x, monster.y)
+
+    def op():
+        monster.move_astar(player, map)
+        map.move_object(monster, start_x, start_y)
+    return op
+
+
+@benchmark('chase')
+def bench_chase():
+    (map, player) = generated_map()
+    monster = [o for o in map._objects if o.ai is not None][-1]
+    (start_x, start_y) = (monster.x, monster.y)
+
+    def op():
+        # a new turn, so the distance field is rebuilt every time
+        map._distances_key = None
+        monster.chase(player, map)
+        map.move_object(monster, start_x, start_y)
+    return op
+
+
+@benchmark('monster_turns')
+def bench_monster_turns():
+    (map, player) = generated_map()
+    monsters = [o for o in map._objects if o.ai is not None]
+    # half of them chase the player, the rest wander around
+    for monster in monsters[::2]:
+        monster.ai.state = AggroState(monster.ai)
+    player.fighter.hp = sys.maxint
+
+    return lambda: map.take_monster_turns(player)
+
+
+@benchmark('draw')
+def bench_draw():
+    (map, player) = generated_map()
+    con = libtcod.console_new(MAP_WIDTH, MAP_HEIGHT)
+
+    def op():
+        map.invalidate_drawing()
+        map.draw(con, player)
+    return op
+
+
+def run(name, setup, min_time=MIN_TIME):
+    op = setup()
+    op()  # warm up caches and lazily built state
+    gc.collect()
+    objects_before = len(gc.get_objects())
+    handles_before = sum(native.live.values())
+    iterations = 0
+    start = time.time()
+    elapsed = 0
+    while elapsed < min_time:
+        op()
+        iterations += 1
+        elapsed = time.time() - start
+    gc.collect()
+    objects_after = len(gc.get_objects())
+    handles_after = sum(native.live.values())
+    return {
+        'ops_per_sec': iterations / elapsed,
+        # objects still alive after the run, per operation. python 2 has no
+        # allocation tracer, so this catches leaks rather than churn
+        'objects_per_op': float(objects_after - objects_before) / iterations,
+        # libtcod maps, paths... still alive after the run, per operation
+        'handles_per_op': float(handles_after - handles_before) / iterations,
+    }
+
+
+def compare(results, baseline, tolerance):
+    # returns the names of the benchmarks that got slower than the baseline
+    # by more than the tolerance
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        before = baseline[name]['ops_per_sec']
+        after = results[name]['ops_per_sec']
+        change = (after - before) / before
+        flag = ''
+        if change < -tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print '%-16s %10.1f -> %10.1f ops/s (%+.0f%%)%s' % (name, before, after, change * 100, flag)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the game\'s hot paths.')
+    parser.add_argument('names', nargs='*', help='benchmarks to run (default: all)')
+    parser.add_argument('--min-time', type=float, default=MIN_TIME)
+    parser.add_argument('--save', metavar='FILE', help='store the results as a baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare against a stored baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed slowdown before failing (default: 0.2 = 20%%)')
+    args = parser.parse_args()
+
+    sounds.enabled = False
+    results = {}
+    for (name, setup) in BENCHMARKS:
+        if args.names and name not in args.names:
+            continue
+        result = run(name, setup, args.min_time)
+        results[name] = result
+        print '%-16s %10.1f ops/s %8.1f objects/op %6.2f handles/op' % (
+            name, result['ops_per_sec'], result['objects_per_op'], result['handles_per_op'])
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        print
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
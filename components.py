@@ -3,40 +3,81 @@ from message import message
 from sounds import play_sound
 from segment import track
 import tiles
+from constants import *
+from bisect import bisect_right
+
+# cumulative xp needed to reach each level: XP_THRESHOLDS[n] is the xp at
+# which level n + 1 starts. every level costs 10% more than the previous one
+XP_THRESHOLDS = [0]
+_next_delta = 100
+
+def xp_threshold(level):
+    # extend the table as far as needed, with the same float accumulation
+    # the levels have always been computed with
+    global _next_delta
+    while len(XP_THRESHOLDS) <= level:
+        XP_THRESHOLDS.append(XP_THRESHOLDS[-1] + _next_delta)
+        _next_delta *= 1.1
+    return XP_THRESHOLDS[level]
+
+def level_for_xp(xp):
+    while XP_THRESHOLDS[-1] <= xp:
+        xp_threshold(len(XP_THRESHOLDS))
+    return bisect_right(XP_THRESHOLDS, xp)
+
+class Weapon(object):
+    # weapons never change once made, so fighters can share them
+    __slots__ = ('name', 'atk')
 
-class Weapon:
     def __init__(self, name, atk=1):
         self.name = name
         self.atk = atk
 
-class Fighter:
-    # combat-related properties and methods (monster, player, NPC).
-    def __init__(self, xp=0, xp_gain=50, hp_base=30, power_base=3,defense_base=0, striked_char=None, death_function=None):
-        self.owner = None
-        self.xp = xp
+FISTS = Weapon('Fists')
+
+class FighterStats(object):
+    # the parts of a fighter that never change. all monsters of one kind
+    # share a single instance
+    __slots__ = ('xp_gain', 'hp_base', 'power_base', 'defense_base', 'striked_char', 'death_function', 'speed')
+
+    def __init__(self, xp_gain=50, hp_base=30, power_base=3, defense_base=0, striked_char=None, death_function=None, speed=NORMAL_SPEED):
         self.xp_gain = xp_gain
         self.hp_base = hp_base
         self.power_base = power_base
         self.defense_base = defense_base
         self.striked_char = striked_char
+        self.death_function = death_function
+        self.speed = speed
+
+class Fighter(object):
+    # combat-related properties and methods (monster, player, NPC).
+    __slots__ = ('owner', 'xp', 'stats', '_level_cache', 'max_hp', 'defense', 'power', 'hp', 'weapon')
+
+    def __init__(self, xp=0, xp_gain=50, hp_base=30, power_base=3,defense_base=0, striked_char=None, death_function=None, stats=None):
+        self.owner = None
+        self.xp = xp
+        # (xp, level) of the last level() call
+        self._level_cache = None
+        if stats is None:
+            stats = FighterStats(xp_gain, hp_base, power_base, defense_base, striked_char, death_function)
+        self.stats = stats
 
         self.set_stats_from_level()
-        self.death_function = death_function
         self.hp = self.max_hp
-        self.weapon = Weapon('Fists')
+        self.weapon = FISTS
 
     def take_damage(self, damage, attacker):
         # apply damage if possible
         if damage > 0:
             self.hp -= damage
 
-            if self.striked_char != None:
-                self.owner.chars.insert(0, self.striked_char)
+            if self.stats.striked_char != None:
+                self.owner.flash(self.stats.striked_char)
             play_sound('hurt.wav')
         # check for death. if there's a death function, call it
         if self.hp <= 0:
-            attacker.grant_xp(self.xp_gain)
-            function = self.death_function
+            attacker.grant_xp(self.stats.xp_gain)
+            function = self.stats.death_function
             victim = str.capitalize(self.owner.name)
             attacker_name = str.capitalize(attacker.owner.name)
             track(attacker_name + ' Defeated ' + victim, {
@@ -50,6 +91,10 @@ class Fighter:
         if target.fighter is None:
             return
 
+        # fights can be heard from afar
+        if self.owner.map is not None:
+            self.owner.map.noise(self.owner.x, self.owner.y, ATTACK_NOISE)
+
         # a simple formula for attack damage
         atk = self.power + self.weapon.atk
         damage = libtcod.random_get_int(0, 0, atk) - libtcod.random_get_int(0, 0, target.fighter.defense)
@@ -82,39 +127,29 @@ class Fighter:
             play_sound('Levelup.wav')
 
     def level(self):
-        xp = 0
-        delta = 100
-        level = 0
-        while xp <= self.xp:
-            level += + 1
-            xp += delta
-            delta *= 1.1
-        return level
+        if self._level_cache is None or self._level_cache[0] != self.xp:
+            self._level_cache = (self.xp, level_for_xp(self.xp))
+        return self._level_cache[1]
 
     def next_xp(self, level):
-        xp = 0
-        delta = 100
-        i = 0
-        while i < level:
-            i += + 1
-            xp += delta
-            delta *= 1.1
-        return int(xp)
+        return int(xp_threshold(max(level, 0)))
 
     def set_stats_from_level(self):
         level = self.level()
-        self.max_hp = self.hp_base + (level - 1) * 10
-        self.defense = self.defense_base + level - 1
-        self.power = self.power_base + level
+        self.max_hp = self.stats.hp_base + (level - 1) * 10
+        self.defense = self.stats.defense_base + level - 1
+        self.power = self.stats.power_base + level
+
 
+class IdleState(object):
+    __slots__ = ('ai',)
 
-class IdleState:
     def __init__(self, ai):
         self.ai = ai
 
     def take_turn(self, map, player):
         monster = self.ai.owner
-        if libtcod.map_is_in_fov(map.fov_map, monster.x, monster.y):
+        if map.is_visible(monster.x, monster.y):
             message('A monster has caught your attention!')
             self.ai.state = AggroState(self.ai)
             return
@@ -126,7 +161,28 @@ class IdleState:
             dy = libtcod.random_get_int(0, -1, 1)
         self.ai.owner.move_by(dx, dy, map)
 
-class AggroState:
+    def catch_up(self, map, turns):
+        # a cheap stand-in for the given number of turns nobody was watching:
+        # wander over the tiles alone, then move there in one go
+        monster = self.ai.owner
+        blocked = map.tiles.blocked
+        (x, y) = (monster.x, monster.y)
+        for _ in range(turns):
+            dx = 0
+            dy = 0
+            if libtcod.random_get_int(0, 0, 1) == 1:
+                dx = libtcod.random_get_int(0, -1, 1)
+            else:
+                dy = libtcod.random_get_int(0, -1, 1)
+            if 0 <= x + dx < map.w and 0 <= y + dy < map.h and not blocked[x + dx + (y + dy) * map.w]:
+                x += dx
+                y += dy
+        if map.blocker_at(x, y) is None:
+            map.move_object(monster, x, y)
+
+class AggroState(object):
+    __slots__ = ('ai',)
+
     def __init__(self, ai):
         self.ai = ai
 
@@ -134,19 +190,21 @@ class AggroState:
     def take_turn(self, map, player):
         # a basic monster takes its turn. If you can see it, it can see you
         monster = self.ai.owner
-        if not libtcod.map_is_in_fov(map.fov_map, monster.x, monster.y):
+        if not map.is_visible(monster.x, monster.y):
             self.ai.state = IdleState(self.ai)
             return
 
         # move towards player if far away
         if monster.distance_to(player) >= self.ai.atk_range:
-            monster.move_astar(player, map)
+            monster.chase(player, map)
 
         # close enough, attack! (if the player is still alive.)
         elif player.fighter.hp > 0:
             monster.fighter.attack(player)
 
-class BasicMonster:
+class BasicMonster(object):
+    __slots__ = ('owner', 'state', 'atk_range')
+
     def __init__(self, atk_range=2):
         self.owner = None
         self.state = IdleState(self)
@@ -156,7 +214,8 @@ class BasicMonster:
         self.state.take_turn(map, player)
 
 
-class ConfusedMonster:
+class ConfusedMonster(object):
+    __slots__ = ('owner', 'old_ai', 'num_turns')
     CONFUSE_RANGE = 5
     CONFUSE_NUM_TURNS = 10
 
@@ -180,7 +239,9 @@ class ConfusedMonster:
                     ' is no longer confused!', libtcod.red)
 
 
-class Item:
+class Item(object):
+    __slots__ = ('owner', 'use_function')
+
     def __init__(self, use_function=None):
         self.owner = None
         self.use_function = use_function
@@ -208,13 +269,15 @@ class Item:
 
     def drop(self, player, map):
         # add to the map and remove from the player's inventory. also, place it at the player's coordinates
-        map.add_object(self.owner)
         player.inventory.remove(self.owner)
         self.owner.x = player.x
         self.owner.y = player.y
+        map.add_object(self.owner)
         message('You dropped a ' + self.owner.name + '.', libtcod.yellow)
 
-class Ladder:
+class Ladder(object):
+    __slots__ = ('owner', 'use_function')
+
     def __init__(self, use_function):
         self.owner = None
         self.use_function = use_function
@@ -223,7 +286,9 @@ class Ladder:
     def ascend(self, objects):
         self.use_function()
 
-class Chest:
+class Chest(object):
+    __slots__ = ('owner', 'items')
+
     def __init__(self, items=[]):
         self.owner = None
         self.items = items
@@ -244,4 +309,4 @@ class Chest:
                         item.x = x
                         item.y = y
                         map.add_object(item)
-        self.owner.chars = [tiles.open_chest_tile]
+        self.owner.set_char(tiles.open_chest_tile)
@@ -49,5 +49,24 @@ class TestStringMethods(unittest.TestCase):
         f.grant_xp(100)
         self.assertEqual(f.max_hp, 20)
 
+    def test_level_boundaries(self):
+        self.assertEqual(Fighter(xp = 99).level(), 1)
+        self.assertEqual(Fighter(xp = 209).level(), 2)
+        self.assertEqual(Fighter(xp = 330).level(), 3)
+        self.assertEqual(Fighter(xp = 100000).level(), 49)
+
+    def test_next_xp(self):
+        f = Fighter()
+        self.assertEqual(f.next_xp(0), 0)
+        self.assertEqual(f.next_xp(1), 100)
+        self.assertEqual(f.next_xp(2), 210)
+        self.assertEqual(f.next_xp(3), 331)
+
+    def test_level_follows_xp(self):
+        f = Fighter(xp = 50)
+        self.assertEqual(f.level(), 1)
+        f.xp = 250
+        self.assertEqual(f.level(), 3)
+
 if __name__ == '__main__':
     unittest.main()
@@ -18,3 +18,8 @@ INVENTORY_WIDTH = 50
 TORCH_RADIUS = 12
 FOV_ALGO = 0  # default FOV algorithm
 FOV_LIGHT_WALLS = True
+
+# how often actors act. NORMAL_SPEED is once per player turn
+NORMAL_SPEED = 100
+# how far (square radius) a fight wakes up parked monsters
+ATTACK_NOISE = 20
@@ -1,12 +1,11 @@
 import libtcodpy as libtcod
-from components import Fighter, BasicMonster, Item, ConfusedMonster, Ladder, Chest, Weapon
+from components import FighterStats, ConfusedMonster, Ladder, Chest, Weapon
+from templates import register, callback, Template, MonsterTemplate, ItemTemplate
 from rect import Rect
 from message import message
-from object import Object
 from sounds import play_sound
 import tiles
 import random
-import math
 
 ROOM_MAX_SIZE = 20
 MEAN_ROOM_SIZE = 10
@@ -22,6 +21,7 @@ LIGHTNING_DAMAGE = 20
 LIGHTNING_RANGE = 5
 
 
+@callback
 def cast_heal(player):
     # heal the player
     if player.fighter.hp == player.fighter.max_hp:
@@ -40,8 +40,8 @@ def closest_monster(player, max_range):
     closest_dist = max_range + 1
 
     map = player.map
-    for object in map._objects:
-        if object.fighter and not object == player and libtcod.map_is_in_fov(map.fov_map, object.x, object.y):
+    for object in map.objects_within(player.x, player.y, max_range):
+        if object.fighter and not object == player and object.is_visible():
             # calculate distance between this object and the player
             dist = player.distance_to(object)
             if dist < closest_dist:  # it's closer, so remember it
@@ -49,6 +49,7 @@ def closest_monster(player, max_range):
                 closest_dist = dist
     return closest_enemy
 
+@callback
 def cast_lightning(player):
     # find closest enemy (inside a maximum range) and damage it
     monster = closest_monster(player, LIGHTNING_RANGE)
@@ -62,6 +63,7 @@ def cast_lightning(player):
             + str(LIGHTNING_DAMAGE) + ' hit points.', libtcod.light_blue)
     monster.fighter.take_damage(LIGHTNING_DAMAGE, player.fighter)
 
+@callback
 def cast_confuse(player):
     # find closest enemy in-range and confuse it
     monster = closest_monster(player, ConfusedMonster.CONFUSE_RANGE)
@@ -76,14 +78,15 @@ def cast_confuse(player):
             ' look vacant, as he starts to stumble around!', libtcod.light_green)
     play_sound('Confuse.wav')
 
+@callback
 def monster_death(monster):
     # transform it into a nasty corpse! it doesn't block, can't be
     # attacked and doesn't move
     message(monster.name.capitalize() + ' is dead!', libtcod.green)
-    monster.chars = [tiles.tomb_tile]
+    monster.set_char(tiles.tomb_tile)
     play_sound('Monsterkill.wav')
     monster.color = libtcod.white
-    monster.blocks = False
+    monster.map.set_blocks(monster, False)
     monster.fighter = None
     monster.ai = None
     if monster.name == 'orc':
@@ -91,62 +94,72 @@ def monster_death(monster):
         if libtcod.random_get_int(0, 0, 100) > 75:
             message(monster.name.capitalize() +
                     ' dropped healing potion!', libtcod.light_amber)
-            item = place_potion(cast_heal, monster.x, monster.y)
+            item = place_potion(monster.x, monster.y)
             monster.map.add_object(item)
     monster.name = 'remains of ' + monster.name
     monster.map.send_to_back(monster)
 
-def place_potion(cast_heal, x, y):
-    item_component = Item(use_function=cast_heal)
-    return Object(x, y, tiles.healingpotion_tile, 'healing potion',
-                    libtcod.white, item=item_component)
+@callback
+def ascend():
+    print("ascending!")
 
-def place_bolt(cast_fn, x, y):
-    item_component = Item(use_function=cast_fn)
-    return Object(x, y, tiles.scroll_tile, 'scroll of lightning bolt',
-                    libtcod.white, item=item_component)
+@callback
+def equip_sword(player):
+    player.fighter.weapon = STEEL_SWORD_WEAPON
+
+STEEL_SWORD_WEAPON = Weapon('Steel Sword', 8)
+
+# the kinds of monsters and items found in the tower
+ORC = register(MonsterTemplate('orc', 'orc', tiles.orc_tile, FighterStats(
+    power_base=2, xp_gain=10, striked_char=tiles.striked_orc_tile, death_function=monster_death)))
+SKELETON = register(MonsterTemplate('skeleton', 'skeleton', tiles.skeleton_tile, FighterStats(
+    power_base=4, defense_base=1, xp_gain=20, death_function=monster_death)))
+WIZARD = register(MonsterTemplate('wizard', 'wizard', tiles.wizard_tile, FighterStats(
+    power_base=2, defense_base=0, xp_gain=30, death_function=monster_death), atk_range=6))
+
+HEALING_POTION = register(ItemTemplate('healing_potion', 'healing potion', tiles.healingpotion_tile, cast_heal))
+LIGHTNING_SCROLL = register(ItemTemplate('lightning_scroll', 'scroll of lightning bolt', tiles.scroll_tile, cast_lightning))
+CONFUSE_SCROLL = register(ItemTemplate('confuse_scroll', 'scroll of confusion', tiles.scroll_tile, cast_confuse,
+                                       color=libtcod.orange))
+STEEL_SWORD = register(ItemTemplate('steel_sword', 'steel sword', tiles.sword_tile, equip_sword))
+
+CHEST = register(Template('chest', 'chest', tiles.chest_tile, blocks=True))
+STAIRS = register(Template('stairs', 'stairs', tiles.stairsdown_tile))
+
+def place_potion(x, y):
+    return HEALING_POTION.spawn(x, y)
+
+def place_bolt(x, y):
+    return LIGHTNING_SCROLL.spawn(x, y)
 
-def place_sword(use_fn, x, y):
-    item_component = Item(use_function=use_fn)
-    return Object(x, y, tiles.sword_tile, 'steel sword',
-                    libtcod.white, item=item_component)
+def place_sword(x, y):
+    return STEEL_SWORD.spawn(x, y)
+
+def walking_distance(distances, x, y):
+    # steps from the root of a distance field to (x, y), or 0 when (x, y)
+    # can't be reached
+    distance = libtcod.dijkstra_get_distance(distances, x, y)
+    if distance < 0:
+        return 0
+    return int(distance)
 
 def place_chest(x, y):
-    item = place_sword(equip_sword, 0, 0)
+    item = place_sword(0, 0)
     chest_component = Chest([item])
-    return Object(x, y, tiles.chest_tile, 'chest',
-                    libtcod.white, chest=chest_component, blocks=True)
-
-def equip_sword(player):
-    player.fighter.weapon = Weapon('Steel Sword', 8)
+    return CHEST.spawn(x, y, chest=chest_component)
 
 class MonsterGenerator:
     @staticmethod
-    def orc(x, y, player, distance, monster_death):
-        fighter_component = Fighter(
-            xp=(int(distance)+player.fighter.xp), power_base=2, xp_gain=10, striked_char=tiles.striked_orc_tile, death_function=monster_death)
-        ai_component = BasicMonster()
-
-        return Object(x, y, tiles.orc_tile, 'orc', libtcod.white,
-                            blocks=True, fighter=fighter_component, ai=ai_component)
+    def orc(x, y, player, distance):
+        return ORC.spawn(x, y, xp=int(distance)+player.fighter.xp)
 
     @staticmethod
-    def skeleton(x, y, player, distance, monster_death):
-        fighter_component = Fighter(
-            xp=(int(distance)+player.fighter.xp), power_base=4, defense_base=1, xp_gain=20, death_function=monster_death)
-        ai_component = BasicMonster()
-
-        return Object(x, y, tiles.skeleton_tile, 'skeleton', libtcod.white,
-                            blocks=True, fighter=fighter_component, ai=ai_component)
+    def skeleton(x, y, player, distance):
+        return SKELETON.spawn(x, y, xp=int(distance)+player.fighter.xp)
 
     @staticmethod
-    def wizard(x, y, player, distance, monster_death):
-        fighter_component = Fighter(
-            xp=(int(distance)+player.fighter.xp), power_base=2, defense_base=0, xp_gain=30, death_function=monster_death)
-        ai_component = BasicMonster(atk_range=6)
-
-        return Object(x, y, tiles.wizard_tile, 'wizard', libtcod.white,
-                            blocks=True, fighter=fighter_component, ai=ai_component)
+    def wizard(x, y, player, distance):
+        return WIZARD.spawn(x, y, xp=int(distance)+player.fighter.xp)
 
 class DungeonGenerator:
     def __init__(self, seed=None):
@@ -162,21 +175,19 @@ class DungeonGenerator:
                 start_x = None
                 start_y = None
             room_tries += 1
-        for x in range(0, map.w):
-            for y in range(0, map.h):
-                tile = map.tiles[x][y]
-                if tile != None and tile.tunnel:
-                    tile.blocked = False
-                    tile.block_sight = False
+        map.tiles.open_tunnels()
         # sort rooms
         first_room = map.rooms[0]
         (x, y) = first_room.center()
-        player.x = x
-        player.y = y
+        map.move_object(player, x, y)
+
+        # walking distances from the start, for all the questions below. it
+        # is computed before any monster is placed, so they don't block it
+        distances = map.distances_to(player)
 
         def sort_fn(room):
             (x, y) = room.center()
-            return player.astar_distance_to(map, x, y)
+            return walking_distance(distances, x, y)
 
         sorted_rooms = sorted(map.rooms, key=sort_fn)
 
@@ -190,10 +201,8 @@ class DungeonGenerator:
         y = self.random_int(exit_room.y1 + 2, exit_room.y2 - 2)
 
         # create a ladder
-        def ascend():
-            print("ascending!")
         ladder_component = Ladder(ascend)
-        ladder = Object(x, y, tiles.stairsdown_tile, 'stairs', libtcod.white, ladder=ladder_component)
+        ladder = STAIRS.spawn(x, y, ladder=ladder_component)
         map.add_object(ladder)
 
         # place chest
@@ -204,10 +213,10 @@ class DungeonGenerator:
         for i in range(1, map.num_rooms):
             # add some contents to this room, such as monsters
             room = map.rooms[i]
-            self.place_objects(map, room, player)
+            self.place_objects(map, room, player, distances)
             # grant some xp for discovering rooms
             (x, y) = room.center()
-            map.tiles[x][y].xp_gain = 20
+            map.tile_at(x, y).xp_gain = 20
         map.set_fov()
 
     def generate_room(self, map, start_x, start_y):
@@ -227,10 +236,9 @@ class DungeonGenerator:
         # "Rect" class makes rectangles easier to work with
         new_room = Rect(x, y, w, h)
 
-        # run through the other rooms and see if they intersect with this one
-        for other_room in map.rooms:
-            if new_room.intersect(other_room):
-                return False
+        # see if it intersects with any of the other rooms
+        if map.room_index.intersecting(new_room):
+            return False
 
         # this means there are no intersections, so this room is valid
 
@@ -246,23 +254,15 @@ class DungeonGenerator:
             map.create_tunnel(prev_x, prev_y, new_x, new_y)
         elif map.num_rooms > 1:
             # For the rest of the rooms:
-            # connect it to the previous room with a tunnel
-            # center coordinates of a random room (except first)
-            def sort_fn(room):
-                (x, y) = room.center()
-                dx = new_x - x
-                dy = new_y - y
-                return math.sqrt(dx ** 2 + dy ** 2)
-            sorted_rooms = sorted(map.rooms[1:], key=sort_fn)
-            (prev_x, prev_y) = sorted_rooms[0].center()
+            # connect it to the closest room with a tunnel (except first)
+            (prev_x, prev_y) = map.room_index.nearest(new_x, new_y, first=1).center()
             map.create_tunnel(prev_x, prev_y, new_x, new_y)
 
         # finally, append the new room to the list
-        map.rooms.append(new_room)
-        map.num_rooms += 1
+        map.add_room(new_room)
         return True
 
-    def place_objects(self, map, room, player):
+    def place_objects(self, map, room, player, distances):
         # choose random number of monsters
         num_monsters = libtcod.random_get_int(
             self.random, 0, MAX_ROOM_MONSTERS)
@@ -274,16 +274,16 @@ class DungeonGenerator:
 
             # only place it if the tile is not blocked
             if not map.tile_at(x, y).blocked:
-                distance = player.astar_distance_to(map, x, y)
+                distance = walking_distance(distances, x, y)
                 dice = self.random_int(0, 50) + (map.floor - 1) * 10
                 if dice < 40:
                     # create an orc
-                    monster = MonsterGenerator.orc(x, y, player, distance, monster_death)
+                    monster = MonsterGenerator.orc(x, y, player, distance)
                 elif dice < 50:
                     # create a skeleton
-                    monster = MonsterGenerator.skeleton(x, y, player, distance, monster_death)
+                    monster = MonsterGenerator.skeleton(x, y, player, distance)
                 else:
-                    monster = MonsterGenerator.wizard(x, y, player, distance, monster_death)
+                    monster = MonsterGenerator.wizard(x, y, player, distance)
 
                 map.add_object(monster)
 
@@ -300,15 +300,13 @@ class DungeonGenerator:
                 item = None
                 if self.chance(50):
                     # create a healing potion (70 % chance)
-                    item = place_potion(cast_heal, x, y)
+                    item = place_potion(x, y)
                 elif self.chance(50):
                     # create a lightning bolt scroll (30% chance)
-                    item = place_bolt(cast_lightning, x, y)
+                    item = place_bolt(x, y)
                 else:
                     # create a confuse scroll (15% chance)
-                    item_component = Item(use_function=cast_confuse)
-                    item = Object(x, y, tiles.scroll_tile, 'scroll of confusion',
-                                  libtcod.orange, item=item_component)
+                    item = CONFUSE_SCROLL.spawn(x, y)
                 map.add_object(item)
 
     def random_int(self, min, max):
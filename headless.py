@@ -0,0 +1,115 @@
+import libtcodpy as libtcod
+import sounds
+import native
+import skyspire
+from dungeon_generator import DungeonGenerator
+import random
+import time
+import argparse
+
+# keys a random player presses: mostly moving around, sometimes picking
+# things up or taking the stairs
+RANDOM_KEYS = 'wasd' * 4 + 'g<'
+
+
+class Key:
+    # stands in for libtcod.Key when there is no window to read keys from
+    def __init__(self, c=0, vk=libtcod.KEY_NONE, lalt=False):
+        self.c = c
+        self.vk = vk
+        self.lalt = lalt
+
+
+class RandomInput:
+    def __init__(self, seed=None, keys=RANDOM_KEYS):
+        self.random = random.Random(seed)
+        self.keys = keys
+
+    def next_key(self):
+        return Key(ord(self.random.choice(self.keys)))
+
+    def choose(self, options):
+        return self.random.randrange(len(options))
+
+
+class ScriptedInput:
+    # plays back a fixed sequence of keys, e.g. 'wwdd<'. menus pick the
+    # first option
+    def __init__(self, keys):
+        self.keys = iter(keys)
+
+    def next_key(self):
+        c = next(self.keys, None)
+        if c is None:
+            return None
+        return Key(ord(c))
+
+    def choose(self, options):
+        return 0
+
+
+class HeadlessGame:
+    # drives new_game/handle_keys/monster turns without a window or sound,
+    # for soak tests and benchmarks
+    def __init__(self, input, seed=None):
+        self.input = input
+        self.seed = seed
+        self.turns = 0
+        self.games = 0
+
+    def start(self):
+        sounds.enabled = False
+        skyspire.generator = DungeonGenerator(self.seed)
+        # menus can't be shown, ask the input source instead
+        skyspire.menu = lambda header, options, width: self.input.choose(options)
+        skyspire.new_game()
+        self.games += 1
+
+    def step(self):
+        # play one key press. returns the player's action, or 'exit' when
+        # the input ran out
+        key = self.input.next_key()
+        if key is None:
+            return 'exit'
+        skyspire.key = key
+        player_action = skyspire.handle_keys()
+        skyspire.process_turn(player_action)
+        if player_action != 'didnt-take-turn':
+            self.turns += 1
+        return player_action
+
+    def run(self, turns, restart=True):
+        self.start()
+        while self.turns < turns:
+            if self.step() == 'exit':
+                break
+            if skyspire.game_state == 'dead':
+                if not restart:
+                    break
+                self.start()
+        return self.turns
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play Skyspire without a window.')
+    parser.add_argument('--turns', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--keys', default=None,
+                        help='keys to play back instead of random input')
+    args = parser.parse_args()
+
+    if args.keys is not None:
+        input = ScriptedInput(args.keys)
+    else:
+        input = RandomInput(args.seed)
+    game = HeadlessGame(input, args.seed)
+    start = time.time()
+    turns = game.run(args.turns)
+    elapsed = time.time() - start
+    print 'Played %d turns in %d game(s), reached floor %d, %.3fs (%.0f turns/s)' % (
+        turns, game.games, skyspire.map.floor, elapsed, turns / max(elapsed, 1e-9))
+    print 'Native handles alive: %s' % native.live_handles()
+
+
+if __name__ == '__main__':
+    main()
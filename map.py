@@ -5,6 +5,11 @@ from components import Fighter, BasicMonster
 from message import message
 from constants import *
 from envparse import env
+from tile_grid import TileGrid
+from renderer import MapRenderer
+from scheduler import Scheduler
+from native import TcodMap, Path, Dijkstra
+from room_index import RoomIndex
 import tiles
 import random
 
@@ -19,18 +24,15 @@ color_light_ground = libtcod.Color(200, 180, 50)
 
 DEBUG = env.bool('DEBUG', default=False)
 
-class Tile:
-    # a tile of the map and its properties
-    def __init__(self, blocked, block_sight=None):
-        self.blocked = blocked
+class VisibleCells:
+    # the cells in FOV, both as a plane (for rendering) and as a list of indexes
+    def __init__(self, n):
+        self.plane = bytearray(n)
+        self.cells = []
 
-        # by default, if a tile is blocked, it also blocks sight
-        if block_sight is None:
-            block_sight = blocked
-        self.block_sight = block_sight
-        self.explored = False
-        self.tunnel = False
-        self.xp_gain = 0
+    def add(self, i):
+        self.plane[i] = 1
+        self.cells.append(i)
 
 
 class Map:
@@ -39,136 +41,408 @@ class Map:
         self.h = h
         self.rooms = []
         self.num_rooms = 0
+        self.room_index = RoomIndex()
         self.floor = floor
-        self.fov_map = libtcod.map_new(self.w, self.h)
+        # libtcod maps for FOV and pathfinding, and a pooled A* path over the
+        # latter (all native.Handle). they are built lazily and then kept in
+        # sync with the tiles
+        self.fov_map = None
+        self.walk_map = None
+        self._path = None
+        self._renderer = None
+        # distances to the player, shared by all chasing monsters, and the
+        # player position they were computed for (reset every turn)
+        self._distances = None
+        self._distances_key = None
+        # bumped every time the FOV is recomputed
+        self.fov_version = 0
+        # player position the FOV was last computed for
+        self._fov_key = None
+        # cells in FOV as of the last fov_recompute
+        self.visible = None
+        # what draw() put on screen last time, to only redraw what changed
+        self._drawn_view = None
+        self._drawn_objects = {}
+        # who acts when, built on the first monster turn
+        self.scheduler = None
         self.torch_left = 10000
         self._objects = []
-        self.tiles = [[Tile(True)
-                       for _ in range(self.h)]
-                      for _ in range(self.w)]
+        # position index: (x, y) -> objects there, and -> blocking objects there
+        self._cells = {}
+        self._blockers = {}
+        self.tiles = TileGrid(self.w, self.h)
+
+    def add_room(self, room):
+        self.rooms.append(room)
+        self.num_rooms += 1
+        self.room_index.add(room)
 
     def create_room(self, room):
         # go through the tiles in the rectangle and make them passable
-        for x in range(room.x1 + 1, room.x2):
-            for y in range(room.y1 + 1, room.y2):
-                self.tiles[x][y].blocked = False
-                self.tiles[x][y].block_sight = False
-        self.tiles[room.x1 + 1][room.y1 + 1].blocked = True
-        self.tiles[room.x1 + 1][room.y1 + 1].block_sight = True
-        self.tiles[room.x1 + 1][room.y2 - 1].blocked = True
-        self.tiles[room.x1 + 1][room.y2 - 1].block_sight = True
-        self.tiles[room.x2 - 1][room.y1 + 1].blocked = True
-        self.tiles[room.x2 - 1][room.y1 + 1].block_sight = True
-        self.tiles[room.x2 - 1][room.y2 - 1].blocked = True
-        self.tiles[room.x2 - 1][room.y2 - 1].block_sight = True
+        self.tiles.fill_rect(room.x1 + 1, room.y1 + 1, room.x2, room.y2, False)
+        # ...except for a pillar in each corner
+        for x in [room.x1 + 1, room.x2 - 1]:
+            for y in [room.y1 + 1, room.y2 - 1]:
+                if 0 <= x < self.w and 0 <= y < self.h:
+                    self.tiles.set_blocked(x, y, True)
 
     def create_tunnel(self, x1, y1, x2, y2):
+        # a corridor of 2x2 blocks from (x1, y1) towards (x2, y2). each step
+        # jogs twice as far as a straight line would along one axis only:
+        # every other step, picked at random, goes vertically
         dx = x2 - x1
         dy = y2 - y1
-
-        coords = []
-        if abs(dx) > abs(dy):
-            steps = abs(dx)
-        else:
-            steps = abs(dy)
-        for n in range(steps):
-            x = float(dx) / float(steps)
-            y = float(dy) / float(steps)
-            coords.append([x, y])
-        elected = coords[:]
+        steps = max(abs(dx), abs(dy))
+        elected = range(steps)
         random.shuffle(elected)
-        for index, coord in enumerate(elected):
-            if index % 2 == 0:
-                coord[0] *= 0
-                coord[1] *= 2
+        vertical = bytearray(steps)
+        for i in elected[::2]:
+            vertical[i] = 1
+
+        positions = []
+        across = 0
+        down = 0
+        for i in range(steps):
+            if vertical[i]:
+                down += 1
             else:
-                coord[0] *= 2
-                coord[1] *= 0
-
-        current = [x1, y1]
-        for (x, y) in coords:
-            current[0] += x
-            current[1] += y
-            self.carve(*current)
-
-    def carve(self, x, y):
-        self.carve_tile(x, y)
-        self.carve_tile(x, y+1)
-        self.carve_tile(x+1, y)
-        self.carve_tile(x+1, y+1)
-
-    def carve_tile(self, x, y):
+                across += 1
+            # where the line from (x1, y1) is after that many steps along
+            # each axis, rounded down
+            positions.append((x1 + 2 * across * dx / steps, y1 + 2 * down * dy / steps))
+        self.tiles.carve_blocks(positions)
+
+    def set_fov(self):
+        self.sync_tiles()
+
+    def sync_tiles(self):
+        # push the tiles that changed since the last sync to the libtcod maps
+        changed = self.tiles.take_changes()
+        if self.fov_map is None:
+            self.fov_map = self._new_fov_map()
+            self.invalidate_fov()
+            return
+        if changed:
+            self.invalidate_fov()
+        blocked = self.tiles.blocked
+        block_sight = self.tiles.block_sight
+        for i in changed:
+            (x, y) = (i % self.w, i / self.w)
+            libtcod.map_set_properties(
+                self.fov_map.handle, x, y, not block_sight[i], not blocked[i])
+            self.update_walkable(x, y)
+
+    def _new_fov_map(self):
+        # build a libtcod map from the tile planes in one go. a fresh libtcod
+        # map is all walls, so only the open cells have to be pushed
+        fov_map = TcodMap(self.w, self.h)
+        blocked = self.tiles.blocked
+        block_sight = self.tiles.block_sight
+        for i in self._open_cells(blocked) | self._open_cells(block_sight):
+            libtcod.map_set_properties(
+                fov_map.handle, i % self.w, i / self.w, not block_sight[i], not blocked[i])
+        return fov_map
+
+    def _open_cells(self, plane):
+        cells = set()
+        i = plane.find(b'\x00')
+        while i != -1:
+            cells.add(i)
+            i = plane.find(b'\x00', i + 1)
+        return cells
+
+    def walkable_map(self):
+        # libtcod map for pathfinding: walls and blocking objects are unwalkable.
+        # it starts as a copy of the FOV map and is then kept in sync
+        self.sync_tiles()
+        if self.walk_map is None:
+            self.walk_map = TcodMap(self.w, self.h)
+            libtcod.map_copy(self.fov_map.handle, self.walk_map.handle)
+            for (x, y) in self._blockers:
+                self.update_walkable(x, y)
+        return self.walk_map.handle
+
+    def update_walkable(self, x, y, ignore=None):
+        # recompute one cell of the pathfinding map. objects in ignore don't
+        # count as blockers (used to free the start and end of a path)
+        if self.walk_map is None:
+            return
         try:
-            x = int(x)
-            y = int(y)
-            self.tiles[x][y].blocked = False
-            self.tiles[x][y].block_sight = False
-            self.tiles[x][y].tunnel = True
+            tile = self.tile_at(x, y)
         except IndexError:
-            return False
+            return
+        walkable = not tile.blocked and self.blocker_at(x, y, ignore) is None
+        libtcod.map_set_properties(self.walk_map.handle, x, y, not tile.block_sight, walkable)
 
-    def set_fov(self):
-        for y in range(self.h):
-            for x in range(self.w):
-                libtcod.map_set_properties(
-                    self.fov_map, x, y, not self.tiles[x][y].block_sight, not self.tiles[x][y].blocked)
+    def path(self):
+        # the map's shared A* path. it is reused for every query, so callers
+        # must not delete it
+        self.walkable_map()
+        if self._path is None:
+            # a diagonal cost of 0 means monsters only move orthogonally
+            self._path = Path(self.walk_map, 0)
+        return self._path.handle
+
+    def distances_to(self, player):
+        # dijkstra map of walking distances to the player, computed at most
+        # once per turn. like the A* path, it only moves orthogonally
+        key = (player.x, player.y)
+        if self._distances_key != key:
+            self.walkable_map()
+            if self._distances is None:
+                self._distances = Dijkstra(self.walk_map, 0)
+            self.update_walkable(player.x, player.y, ignore=(player,))
+            libtcod.dijkstra_compute(self._distances.handle, player.x, player.y)
+            self.update_walkable(player.x, player.y)
+            self._distances_key = key
+        return self._distances.handle
+
+    def release(self):
+        # free the native handles right away, for a map that is done with.
+        # they would be rebuilt if the map was used again
+        for handle in [self._distances, self._path, self.walk_map, self.fov_map]:
+            if handle is not None:
+                handle.close()
+        self._distances = None
+        self._distances_key = None
+        self._path = None
+        self.walk_map = None
+        self.fov_map = None
+        self.invalidate_fov()
+
+    def invalidate_fov(self):
+        # call when something that affects sight changed, so that the next
+        # fov_recompute really recomputes
+        self._fov_key = None
 
     def fov_recompute(self, player):
+        # FOV only depends on where the player stands and on the tiles, so
+        # it is only recomputed when one of them changed
+        self.sync_tiles()
+        if self._fov_key == (player.x, player.y):
+            return
+        self._fov_key = (player.x, player.y)
+        self.fov_version += 1
         libtcod.map_compute_fov(
-            self.fov_map, player.x, player.y, TORCH_RADIUS, FOV_LIGHT_WALLS, FOV_ALGO)
+            self.fov_map.handle, player.x, player.y, TORCH_RADIUS, FOV_LIGHT_WALLS, FOV_ALGO)
+        # snapshot the result so visibility checks don't have to go through
+        # libtcod. only cells within the torch radius can be lit
+        self.visible = VisibleCells(self.w * self.h)
+        for y in range(max(player.y - TORCH_RADIUS, 0), min(player.y + TORCH_RADIUS + 1, self.h)):
+            for x in range(max(player.x - TORCH_RADIUS, 0), min(player.x + TORCH_RADIUS + 1, self.w)):
+                if libtcod.map_is_in_fov(self.fov_map.handle, x, y):
+                    self.visible.add(x + y * self.w)
+
+    def is_visible(self, x, y):
+        # whether (x, y) was in FOV at the last fov_recompute
+        if self.visible is None or not (0 <= x < self.w and 0 <= y < self.h):
+            return False
+        return self.visible.plane[x + y * self.w] == 1
 
     def tile_at(self, x, y):
-        return self.tiles[x][y]
+        return self.tiles.at(x, y)
+
+    def objects_at(self, x, y):
+        # a copy, so callers can add or remove objects while looping over it
+        return list(self._cells.get((x, y), ()))
+
+    def blocker_at(self, x, y, ignore=None):
+        for object in self._blockers.get((x, y), ()):
+            if ignore is None or object not in ignore:
+                return object
+        return None
+
+    def objects_within(self, x, y, radius):
+        # objects in the square of the given radius around (x, y)
+        found = []
+        for cy in range(y - radius, y + radius + 1):
+            for cx in range(x - radius, x + radius + 1):
+                found.extend(self._cells.get((cx, cy), ()))
+        return found
+
+    def _index(self, object):
+        self._cells.setdefault((object.x, object.y), []).append(object)
+        if object.blocks:
+            self._blockers.setdefault((object.x, object.y), []).append(object)
+
+    def _unindex(self, object):
+        self._discard(self._cells, object)
+        if object.blocks:
+            self._discard(self._blockers, object)
+
+    def _discard(self, index, object):
+        pos = (object.x, object.y)
+        bucket = index[pos]
+        bucket.remove(object)
+        if not bucket:
+            del index[pos]
+
+    def _reindex(self):
+        self._cells = {}
+        self._blockers = {}
+        for object in self._objects:
+            self._index(object)
 
     def add_object(self, object):
         object.map = self
         self._objects.append(object)
+        self._index(object)
+        if object.blocks:
+            self.update_walkable(object.x, object.y)
+        if self.scheduler is not None:
+            self.scheduler.add(object)
 
     def remove_object(self, object):
         object.map = None
         self._objects.remove(object)
+        self._unindex(object)
+        if object.blocks:
+            self.update_walkable(object.x, object.y)
+
+    def move_object(self, object, x, y):
+        (old_x, old_y) = (object.x, object.y)
+        self._unindex(object)
+        object.x = x
+        object.y = y
+        self._index(object)
+        if object.blocks:
+            self.update_walkable(old_x, old_y)
+            self.update_walkable(x, y)
+
+    def set_blocks(self, object, blocks):
+        self._unindex(object)
+        object.blocks = blocks
+        self._index(object)
+        self.update_walkable(object.x, object.y)
 
     def send_to_back(self, object):
-        self.remove_object(object)
+        self._objects.remove(object)
         self._objects.insert(0, object)
 
+    def take_monster_turns(self, player):
+        if self.scheduler is None:
+            self.scheduler = Scheduler(self)
+        # monsters moved since the last turn
+        self._distances_key = None
+        self.scheduler.run_turn(player)
+
+    def noise(self, x, y, radius):
+        # wake up the parked monsters that can hear (x, y)
+        if self.scheduler is not None:
+            self.scheduler.wake_within(x, y, radius)
+
+    def __getstate__(self):
+        # native libtcod handles can't be saved, they are rebuilt on load.
+        # the position index is rebuilt from the object list
+        state = self.__dict__.copy()
+        state['fov_map'] = None
+        state['walk_map'] = None
+        state['visible'] = None
+        state['_path'] = None
+        state['_distances'] = None
+        state['_distances_key'] = None
+        state['_renderer'] = None
+        state['_drawn_view'] = None
+        state['_drawn_objects'] = {}
+        state['scheduler'] = None
+        del state['_cells']
+        del state['_blockers']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.fov_map = None
+        self.walk_map = None
+        self.visible = None
+        self._fov_key = None
+        self._path = None
+        self._distances = None
+        self._distances_key = None
+        self._renderer = None
+        self._drawn_view = None
+        self._drawn_objects = {}
+        self.scheduler = None
+        self._reindex()
+
+    def _visible_cells(self, player, min_x, max_x, min_y, max_y):
+        # the cells to draw as lit: the FOV snapshot, or the whole viewport
+        # when debugging
+        if not DEBUG:
+            return self.visible or VisibleCells(self.w * self.h)
+        visible = VisibleCells(self.w * self.h)
+        for y in range(min_y, max_y):
+            for x in range(min_x, max_x):
+                visible.add(x + y * self.w)
+        return visible
+
+    def invalidate_drawing(self):
+        # forget what is on screen, so the next draw() redraws everything
+        self._drawn_view = None
+
+    def _visible_objects(self, player):
+        # cell -> the glyphs drawn there, in drawing order (player last)
+        drawn = {}
+        for object in self._objects:
+            if object != player:
+                if DEBUG or self.is_visible(object.x, object.y):
+                    drawn.setdefault((object.x, object.y), []).append(object)
+        drawn.setdefault((player.x, player.y), []).append(player)
+        return drawn
+
+    def _draw_objects(self, con, player, objects):
+        for object in objects:
+            if object == player:
+                object.draw(con, 0)
+            else:
+                distance = int(player.distance_to(object) * 16)
+                object.draw(con, distance)
+
     def draw(self, con, player):
+        # returns 'all' when the whole view was redrawn, 'cells' when only
+        # the cells whose objects changed were, and None when nothing changed
+        # since the last call
+        view = (player.x, player.y, self.fov_version)
+        drawn = self._visible_objects(player)
+        glyphs = dict((cell, [o.char for o in objects])
+                      for (cell, objects) in drawn.items())
+        if view == self._drawn_view:
+            # same view: only redraw the cells whose objects changed
+            dirty = [cell for cell in set(glyphs) | set(self._drawn_objects)
+                     if glyphs.get(cell) != self._drawn_objects.get(cell)]
+            if not dirty:
+                return None
+            for (x, y) in dirty:
+                self._renderer.redraw_cell(con, x, y)
+                self._draw_objects(con, player, drawn.get((x, y), ()))
+            self._drawn_objects = glyphs
+            return 'cells'
+
+        self._draw_tiles(con, player)
+        for objects in drawn.values():
+            if player not in objects:
+                self._draw_objects(con, player, objects)
+        # the player goes on top of everything else
+        self._draw_objects(con, player, drawn[(player.x, player.y)])
+        self._drawn_view = view
+        self._drawn_objects = glyphs
+        return 'all'
+
+    def _draw_tiles(self, con, player):
         min_x = max(0, player.x - SCREEN_WIDTH / 2 - 2)
         max_x = min(player.x + SCREEN_WIDTH / 2 - 2, self.w)
         min_y = max(0, player.y - PANEL_Y / 2 - 2)
         max_y = min(player.y + PANEL_Y / 2 - 2, self.h)
-        for y in range(min_y, max_y):
-            for x in range(min_x, max_x):
-                visible = libtcod.map_is_in_fov(self.fov_map, x, y)
-                wall = self.tiles[x][y].block_sight
-                if not visible and not DEBUG:
-                    # if it's not visible right now, the player can only see it if it's explored
-                    if self.tiles[x][y].explored:
-                        # it's out of the player's FOV
-                        if wall:
-                            libtcod.console_put_char_ex(
-                                con, x, y, tiles.wall_tile, libtcod.darker_gray, libtcod.black)
-                        else:
-                            libtcod.console_put_char_ex(
-                                con, x, y, tiles.floor_tile, libtcod.darker_gray, libtcod.black)
-                else:
-                    # it's visible
-                    distance = int(player.distance_to(x, y) * 16)
-                    tint = libtcod.Color(255-distance, 249-distance, 249-distance)
-                    if wall:
-                        libtcod.console_put_char_ex(
-                            con, x, y, tiles.wall_tile, tint, libtcod.black)
-                    else:
-                        libtcod.console_put_char_ex(
-                            con, x, y, tiles.floor_tile, tint, libtcod.black)
-                    # since it's visible, explore it
-                    tile = self.tiles[x][y]
-                    if not tile.explored:
-                        player.fighter.grant_xp(tile.xp_gain)
-                        tile.explored = True
-        for object in self._objects:
-            if object != player:
-                if DEBUG or libtcod.map_is_in_fov(self.fov_map, object.x, object.y):
-                    distance = int(player.distance_to(object) * 16)
-                    object.draw(con, distance)
-        player.draw(con, 0)
+        visible = self._visible_cells(player, min_x, max_x, min_y, max_y)
+
+        # since it's visible, explore it
+        explored = self.tiles.explored
+        xp_gain = self.tiles.xp_gain
+        for i in visible.cells:
+            if not explored[i]:
+                player.fighter.grant_xp(xp_gain[i])
+                explored[i] = 1
+
+        if self._renderer is None:
+            self._renderer = MapRenderer(self.w, self.h)
+        self._renderer.render(con, self.tiles, visible.plane, player, min_x, max_x, min_y, max_y)
+
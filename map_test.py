@@ -0,0 +1,107 @@
+import unittest
+import libtcodpy as libtcod
+from map import Map
+from object import Object
+
+class TestMapIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.map = Map(10, 10, 1)
+        self.map.tiles.fill_rect(0, 0, 10, 10, False)
+
+    def test_objects_at(self):
+        item = Object(2, 3, 'i', 'item', libtcod.white)
+        self.map.add_object(item)
+        self.assertEqual(self.map.objects_at(2, 3), [item])
+        self.assertEqual(self.map.objects_at(3, 2), [])
+        self.map.remove_object(item)
+        self.assertEqual(self.map.objects_at(2, 3), [])
+
+    def test_blocker_follows_moves(self):
+        orc = Object(2, 3, 'o', 'orc', libtcod.white, blocks=True)
+        self.map.add_object(orc)
+        orc.move(2, 4, self.map)
+        self.assertIsNone(self.map.blocker_at(2, 3))
+        self.assertIs(self.map.blocker_at(2, 4), orc)
+        self.assertIsNone(self.map.blocker_at(2, 4, ignore=(orc,)))
+
+    def test_blockers_stop_moves(self):
+        orc = Object(2, 3, 'o', 'orc', libtcod.white, blocks=True)
+        troll = Object(2, 4, 't', 'troll', libtcod.white, blocks=True)
+        self.map.add_object(orc)
+        self.map.add_object(troll)
+        orc.move(2, 4, self.map)
+        self.assertEqual((orc.x, orc.y), (2, 3))
+        self.map.set_blocks(troll, False)
+        orc.move(2, 4, self.map)
+        self.assertEqual((orc.x, orc.y), (2, 4))
+        self.assertEqual(len(self.map.objects_at(2, 4)), 2)
+
+    def test_objects_within(self):
+        near = Object(4, 4, 'i', 'near', libtcod.white)
+        far = Object(9, 9, 'i', 'far', libtcod.white)
+        self.map.add_object(near)
+        self.map.add_object(far)
+        self.assertEqual(self.map.objects_within(3, 3, 2), [near])
+
+class TestMapSync(unittest.TestCase):
+
+    def test_fov_map_follows_tiles(self):
+        map = Map(10, 10, 1)
+        map.tiles.fill_rect(2, 2, 5, 5, False)
+        map.set_fov()
+        self.assertTrue(libtcod.map_is_walkable(map.fov_map.handle, 3, 3))
+        self.assertFalse(libtcod.map_is_walkable(map.fov_map.handle, 6, 6))
+        # later changes are pushed incrementally
+        map.tiles.set_blocked(3, 3, True)
+        map.tiles.set_blocked(6, 6, False)
+        map.sync_tiles()
+        self.assertFalse(libtcod.map_is_walkable(map.fov_map.handle, 3, 3))
+        self.assertTrue(libtcod.map_is_transparent(map.fov_map.handle, 6, 6))
+
+    def test_walkable_map_has_blockers(self):
+        map = Map(10, 10, 1)
+        map.tiles.fill_rect(0, 0, 10, 10, False)
+        orc = Object(4, 4, 'o', 'orc', libtcod.white, blocks=True)
+        map.add_object(orc)
+        walk_map = map.walkable_map()
+        self.assertFalse(libtcod.map_is_walkable(walk_map, 4, 4))
+        orc.move(5, 4, map)
+        self.assertTrue(libtcod.map_is_walkable(walk_map, 4, 4))
+        self.assertFalse(libtcod.map_is_walkable(walk_map, 5, 4))
+
+    def test_fov_recompute_is_skipped_when_nothing_changed(self):
+        map = Map(10, 10, 1)
+        map.tiles.fill_rect(0, 0, 10, 10, False)
+        player = Object(4, 4, '@', 'player', libtcod.white, blocks=True)
+        map.add_object(player)
+        map.fov_recompute(player)
+        version = map.fov_version
+        map.fov_recompute(player)
+        self.assertEqual(map.fov_version, version)
+        # a wall appearing changes what the player can see
+        map.tiles.set_blocked(5, 4, True)
+        map.fov_recompute(player)
+        self.assertEqual(map.fov_version, version + 1)
+        player.move(4, 5, map)
+        map.fov_recompute(player)
+        self.assertEqual(map.fov_version, version + 2)
+
+    def test_monsters_chase_down_the_distance_field(self):
+        map = Map(10, 10, 1)
+        map.tiles.fill_rect(1, 1, 9, 9, False)
+        # a wall between the two, with a gap at the bottom
+        map.tiles.fill_rect(5, 1, 6, 8, True)
+        player = Object(7, 2, '@', 'player', libtcod.white, blocks=True)
+        orc = Object(4, 2, 'o', 'orc', libtcod.white, blocks=True)
+        map.add_object(player)
+        map.add_object(orc)
+        distances = map.distances_to(player)
+        self.assertEqual(libtcod.dijkstra_get_distance(distances, 7, 3), 1)
+        self.assertEqual(libtcod.dijkstra_get_distance(distances, 5, 8), 8)
+        orc.chase(player, map)
+        self.assertEqual((orc.x, orc.y), (4, 3))
+        self.assertIs(map.blocker_at(4, 3), orc)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import libtcodpy as libtcod
+from collections import Counter
+
+# how many native handles of each kind are alive. over a long game these
+# should stay flat, anything that keeps growing is a leak
+live = Counter()
+
+
+class Handle(object):
+    # owns one libtcod handle and frees it on close(), at the end of a with
+    # block, or at the latest when it is garbage collected. `handle` is the
+    # value the libtcodpy functions take. subclasses name their kind and the
+    # libtcodpy function that frees them
+    kind = None
+    delete = None
+
+    def __init__(self, handle, parent=None):
+        if self.kind is None or self.delete is None:
+            raise ValueError('Handle subclasses need a kind and a delete function.')
+        self.handle = handle
+        # handles built on top of another one keep it alive
+        self.parent = parent
+        live[self.kind] += 1
+
+    def close(self):
+        if self.handle is not None:
+            self.delete(self.handle)
+            self.handle = None
+            self.parent = None
+            live[self.kind] -= 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            # at interpreter exit libtcodpy may already be gone, and so is
+            # everything it allocated
+            pass
+
+
+class TcodMap(Handle):
+    kind = 'map'
+    delete = staticmethod(libtcod.map_delete)
+
+    def __init__(self, w, h):
+        Handle.__init__(self, libtcod.map_new(w, h))
+
+
+class Path(Handle):
+    kind = 'path'
+    delete = staticmethod(libtcod.path_delete)
+
+    def __init__(self, map, dcost=1.41):
+        Handle.__init__(self, libtcod.path_new_using_map(map.handle, dcost), map)
+
+
+class Dijkstra(Handle):
+    kind = 'dijkstra'
+    delete = staticmethod(libtcod.dijkstra_delete)
+
+    def __init__(self, map, dcost=1.41):
+        Handle.__init__(self, libtcod.dijkstra_new(map.handle, dcost), map)
+
+
+class Console(Handle):
+    kind = 'console'
+    delete = staticmethod(libtcod.console_delete)
+
+    def __init__(self, w, h):
+        Handle.__init__(self, libtcod.console_new(w, h))
+
+
+def live_handles():
+    # a snapshot of the counts, without the kinds that are down to zero
+    return dict((kind, count) for (kind, count) in live.items() if count)
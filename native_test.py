@@ -0,0 +1,46 @@
+import unittest
+import libtcodpy as libtcod
+import native
+from native import TcodMap, Path
+from map import Map
+from object import Object
+
+class TestHandles(unittest.TestCase):
+
+    def test_with_block_frees(self):
+        before = native.live['map']
+        with TcodMap(10, 10) as tcod_map:
+            self.assertEqual(native.live['map'], before + 1)
+        self.assertIsNone(tcod_map.handle)
+        self.assertEqual(native.live['map'], before)
+        # closing twice is fine
+        tcod_map.close()
+        self.assertEqual(native.live['map'], before)
+
+    def test_handles_need_a_delete_function(self):
+        before = sum(native.live.values())
+        self.assertRaises(ValueError, native.Handle, object())
+        self.assertEqual(sum(native.live.values()), before)
+
+    def test_garbage_collected_handles_are_freed(self):
+        before = native.live['path']
+        path = Path(TcodMap(10, 10), 0)
+        self.assertEqual(native.live['path'], before + 1)
+        del path
+        self.assertEqual(native.live['path'], before)
+
+    def test_map_release(self):
+        before = sum(native.live.values())
+        map = Map(10, 10, 1)
+        map.tiles.fill_rect(0, 0, 10, 10, False)
+        player = Object(4, 4, '@', 'player', libtcod.white, blocks=True)
+        map.add_object(player)
+        map.fov_recompute(player)
+        map.path()
+        map.distances_to(player)
+        self.assertEqual(sum(native.live.values()), before + 4)
+        map.release()
+        self.assertEqual(sum(native.live.values()), before)
+
+if __name__ == '__main__':
+    unittest.main()
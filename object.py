@@ -2,19 +2,29 @@ import libtcodpy as libtcod
 import math
 
 
-class Object:
+class Object(object):
     # this is a generic object: the player, a monster, an item, the stairs...
     # it's always represented by a character on screen.
-    def __init__(self, x, y, char, name, color, blocks=False, fighter=None, ai=None, item=None, ladder=None, chest=None):
+    # floors hold hundreds of these, so they have slots instead of a __dict__
+    __slots__ = ('x', 'y', 'char', '_next_chars', 'color', 'name', 'fighter', 'blocks',
+                 '_inventory', 'map', 'kind', 'ai', 'item', 'ladder', 'chest')
+
+    def __init__(self, x, y, char, name, color, blocks=False, fighter=None, ai=None, item=None, ladder=None, chest=None, kind=None):
         self.x = x
         self.y = y
-        self.chars = [char]
+        # the glyph shown now, and the ones to show on the next frames (only
+        # while an animation is playing)
+        self.char = char
+        self._next_chars = None
         self.color = color
         self.name = name
         self.fighter = fighter
         self.blocks = blocks
-        self.inventory = []
+        # only objects that pick things up get an inventory list
+        self._inventory = None
         self.map = None
+        # the Template this object was made from, if any
+        self.kind = kind
         if self.fighter:  # let the fighter component know who owns it
             self.fighter.owner = self
 
@@ -31,6 +41,24 @@ class Object:
         if self.chest:# let the Chest component know who owns it
             self.chest.owner = self
 
+    @property
+    def inventory(self):
+        if self._inventory is None:
+            self._inventory = []
+        return self._inventory
+
+    def set_char(self, char):
+        # change the glyph for good, dropping any animation in progress
+        self.char = char
+        self._next_chars = None
+
+    def flash(self, char):
+        # show another glyph for one frame, then go back to the current one
+        if self._next_chars is None:
+            self._next_chars = []
+        self._next_chars.insert(0, self.char)
+        self.char = char
+
     def move_or_attack(self, dx, dy, map):
         # the coordinates the player is moving to/attacking
         x = self.x + dx
@@ -38,8 +66,8 @@ class Object:
 
         # try to find an attackable object there
         target = None
-        for object in map._objects:
-            if object.x == x and object.y == y and (object.chest is not None or object.fighter is not None):
+        for object in map.objects_at(x, y):
+            if object.chest is not None or object.fighter is not None:
                 target = object
                 break
 
@@ -60,13 +88,11 @@ class Object:
             if map.tile_at(x, y).blocked:
                 return
 
-            for object in map._objects:
-                if object.blocks and object.x == x and object.y == y:
-                    return
+            if map.blocker_at(x, y) is not None:
+                return
 
             # move by the given amount
-            self.x = x
-            self.y = y
+            map.move_object(self, x, y)
         except IndexError:
             return False
 
@@ -83,48 +109,58 @@ class Object:
         self.move(self.x + dx, self.y + dy, map)
 
     def move_astar(self, target, map):
+        #Compute the path between self's coordinates and the target's coordinates
         my_path = self.astar_path(map, target.x, target.y, target)
 
-        #Compute the path between self's coordinates and the target's coordinates
-        libtcod.path_compute(my_path, self.x, self.y, target.x, target.y)
         #Check if the path exists, and in this case, also the path is shorter than 25 tiles
         #The path size matters if you want the monster to use alternative longer paths (for example through other rooms) if for example the player is in a corridor
         #It makes sense to keep path size relatively low to keep the monsters from running around the map if there's an alternative path really far away
         if not libtcod.path_is_empty(my_path) and libtcod.path_size(my_path) < 25:
             #Find the next coordinates in the computed full path
-            x, y = libtcod.path_walk(my_path, True)
+            x, y = libtcod.path_get(my_path, 0)
             if x or y:
                 #Set self's coordinates to the next path tile
-                self.x = x
-                self.y = y
+                map.move_object(self, x, y)
         else:
             #Keep the old move function as a backup so that if there are no paths (for example another monster blocks a corridor)
             #it will still try to move towards the player (closer to the corridor opening)
             self.move_towards(target.x, target.y, map)
 
-        #Delete the path to free memory
-        libtcod.path_delete(my_path)
+    def chase(self, target, map):
+        #Walk down the map's distance field towards the target. The field is shared by every monster chasing the
+        #target this turn, so this costs a few lookups instead of a whole A* search
+        distances = map.distances_to(target)
+        step = None
+        for (x, y) in [(self.x, self.y - 1), (self.x - 1, self.y), (self.x + 1, self.y), (self.x, self.y + 1)]:
+            distance = libtcod.dijkstra_get_distance(distances, x, y)
+            if distance >= 0 and (step is None or distance < step[0]):
+                step = (distance, x, y)
+
+        #Same rules as move_astar: only follow paths shorter than 25 tiles, and otherwise just head towards the target
+        if step is not None and step[0] + 1 < 25:
+            (distance, x, y) = step
+            #Someone may have stepped there since the field was computed
+            if map.blocker_at(x, y) is None:
+                map.move_object(self, x, y)
+        else:
+            self.move_towards(target.x, target.y, map)
 
     def astar_path(self, map, x, y, target=None):
-        #Create a FOV map that has the dimensions of the map
-        fov = libtcod.map_new(map.w, map.h)
+        #The map keeps a walkability map where walls and blocking objects are unwalkable,
+        #and a single A* path over it that is reused for every query
+        path = map.path()
 
-        #Scan the current map each turn and set all the walls as unwalkable
-        for y1 in range(map.h):
-            for x1 in range(map.w):
-                libtcod.map_set_properties(fov, x1, y1, not map.tiles[x1][y1].block_sight, not map.tiles[x1][y1].blocked)
-
-        #Scan all the objects to see if there are objects that must be navigated around
-        #Check also that the object isn't self or the target (so that the start and the end points are free)
+        #Free self and the target for the duration of the query so that the start and the end points are walkable
         #The AI class handles the situation if self is next to the target so it will not use this A* function anyway
-        for obj in map._objects:
-            if obj.blocks and obj != self and obj != target:
-                #Set the tile as a wall so it must be navigated around
-                libtcod.map_set_properties(fov, obj.x, obj.y, True, False)
+        freed = (self, target)
+        map.update_walkable(self.x, self.y, ignore=freed)
+        map.update_walkable(x, y, ignore=freed)
+        libtcod.path_compute(path, self.x, self.y, x, y)
+        map.update_walkable(self.x, self.y)
+        map.update_walkable(x, y)
 
-        #Allocate a A* path
-        #The 1.41 is the normal diagonal cost of moving, it can be set as 0.0 if diagonal moves are prohibited
-        return libtcod.path_new_using_map(fov, 0)
+        #The path belongs to the map, don't delete it
+        return path
 
     def distance_to(self, x, y=None):
         if y == None:
@@ -143,10 +179,12 @@ class Object:
             y = other.y
         # return the distance to another object
         my_path = self.astar_path(map, x, y)
-        #Compute the path between self's coordinates and the target's coordinates
-        libtcod.path_compute(my_path, self.x, self.y, x, y)
         return libtcod.path_size(my_path)
 
+    def is_visible(self):
+        # whether the player could see this object at the last FOV update
+        return self.map is not None and self.map.is_visible(self.x, self.y)
+
     def display_name(self):
         if self.fighter == None:
             return self.name
@@ -157,9 +195,11 @@ class Object:
         # set the color and then draw the character that represents this object at its position
         libtcod.console_set_default_foreground(con, tint)
         libtcod.console_put_char(
-            con, self.x, self.y, self.chars[0], libtcod.BKGND_NONE)
-        if len(self.chars) > 1:
-            self.chars.pop(0)
+            con, self.x, self.y, self.char, libtcod.BKGND_NONE)
+        if self._next_chars:
+            self.char = self._next_chars.pop(0)
+            if not self._next_chars:
+                self._next_chars = None
 
     def clear(self, con):
         # erase the character that represents this object
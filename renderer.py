@@ -0,0 +1,117 @@
+import libtcodpy as libtcod
+import tiles
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DARK_FORE = (libtcod.darker_gray.r, libtcod.darker_gray.g, libtcod.darker_gray.b)
+BACK = (libtcod.black.r, libtcod.black.g, libtcod.black.b)
+
+
+def tint_for(distance_squared):
+    # lit tiles fade with the distance to the player
+    d = int(math.sqrt(distance_squared) * 16)
+    return (max(255 - d, 0), max(249 - d, 0), max(249 - d, 0))
+
+
+class MapRenderer:
+    # draws the map tiles into a console with libtcod's fill functions: the
+    # char/foreground/background planes are computed in one pass and pushed
+    # with a handful of calls instead of one call per cell.
+    # uses NumPy when it is installed, libtcod's ConsoleBuffer otherwise.
+    def __init__(self, w, h):
+        self.w = w
+        self.h = h
+        self._tints = {}
+        if numpy is not None:
+            self.char = numpy.full((h, w), ord(' '), dtype=numpy.int32)
+            self.fore = numpy.zeros((3, h, w), dtype=numpy.int32)
+            self.back = numpy.empty((3, h, w), dtype=numpy.int32)
+            for c in range(3):
+                self.back[c] = BACK[c]
+            self.buffer = None
+        else:
+            self.buffer = libtcod.ConsoleBuffer(w, h, *(BACK + (0, 0, 0)))
+
+    def tint(self, distance_squared):
+        tint = self._tints.get(distance_squared)
+        if tint is None:
+            tint = tint_for(distance_squared)
+            self._tints[distance_squared] = tint
+        return tint
+
+    def render(self, con, grid, visible, player, min_x, max_x, min_y, max_y):
+        # visible is a plane with 1 for every cell in the player's FOV.
+        # cells outside [min_x, max_x) x [min_y, max_y) keep their last contents
+        if numpy is not None:
+            self._render_numpy(grid, visible, player, min_x, max_x, min_y, max_y)
+            libtcod.console_fill_char(con, self.char.ravel())
+            libtcod.console_fill_foreground(con, self.fore[0].ravel(), self.fore[1].ravel(), self.fore[2].ravel())
+            libtcod.console_fill_background(con, self.back[0].ravel(), self.back[1].ravel(), self.back[2].ravel())
+        else:
+            self._render_lists(grid, visible, player, min_x, max_x, min_y, max_y)
+            self.buffer.blit(con)
+
+    def cell(self, x, y):
+        # the tile char and foreground color last rendered at (x, y)
+        if self.buffer is None:
+            return (self.char[y, x], tuple(self.fore[:, y, x]))
+        i = x + y * self.w
+        buf = self.buffer
+        return (buf.char[i], (buf.fore_r[i], buf.fore_g[i], buf.fore_b[i]))
+
+    def redraw_cell(self, con, x, y):
+        # put the last rendered tile back at (x, y), e.g. after an object left it
+        (char, fore) = self.cell(x, y)
+        libtcod.console_put_char_ex(
+            con, x, y, int(char), libtcod.Color(*[int(c) for c in fore]), libtcod.Color(*BACK))
+
+    def _render_lists(self, grid, visible, player, min_x, max_x, min_y, max_y):
+        buf = self.buffer
+        char = buf.char
+        fore_r = buf.fore_r
+        fore_g = buf.fore_g
+        fore_b = buf.fore_b
+        block_sight = grid.block_sight
+        explored = grid.explored
+        (dark_r, dark_g, dark_b) = DARK_FORE
+        blank = ord(' ')
+        for y in range(min_y, max_y):
+            dy2 = (y - player.y) ** 2
+            i = min_x + y * self.w
+            for x in range(min_x, max_x):
+                if visible[i]:
+                    (fore_r[i], fore_g[i], fore_b[i]) = self.tint((x - player.x) ** 2 + dy2)
+                    char[i] = tiles.wall_tile if block_sight[i] else tiles.floor_tile
+                elif explored[i]:
+                    # it's out of the player's FOV, but remembered
+                    fore_r[i] = dark_r
+                    fore_g[i] = dark_g
+                    fore_b[i] = dark_b
+                    char[i] = tiles.wall_tile if block_sight[i] else tiles.floor_tile
+                else:
+                    char[i] = blank
+                i += 1
+
+    def _render_numpy(self, grid, visible, player, min_x, max_x, min_y, max_y):
+        if min_x >= max_x or min_y >= max_y:
+            return
+        window = (slice(min_y, max_y), slice(min_x, max_x))
+        shape = (self.h, self.w)
+        wall = numpy.frombuffer(bytes(grid.block_sight), dtype=numpy.uint8).reshape(shape)[window]
+        explored = numpy.frombuffer(bytes(grid.explored), dtype=numpy.uint8).reshape(shape)[window]
+        lit = numpy.frombuffer(bytes(visible), dtype=numpy.uint8).reshape(shape)[window] != 0
+        seen = lit | (explored != 0)
+
+        char = numpy.where(wall != 0, tiles.wall_tile, tiles.floor_tile)
+        self.char[window] = numpy.where(seen, char, ord(' '))
+
+        ys, xs = numpy.ogrid[min_y:max_y, min_x:max_x]
+        d = (numpy.sqrt((xs - player.x) ** 2 + (ys - player.y) ** 2) * 16).astype(numpy.int32)
+        lit_fore = (255 - d, 249 - d, 249 - d)
+        for c in range(3):
+            fore = numpy.where(lit, numpy.maximum(lit_fore[c], 0), DARK_FORE[c])
+            self.fore[c][window] = numpy.where(seen, fore, self.fore[c][window])
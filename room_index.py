@@ -0,0 +1,73 @@
+# side of the square buckets rooms are sorted into. about the size of an
+# average room, so a query only looks at a handful of buckets
+BUCKET_SIZE = 8
+
+
+class RoomIndex(object):
+    # the rooms of a map, bucketed on a uniform grid. a room goes in every
+    # bucket its rectangle (edges included) touches, and also in the bucket of
+    # its center for nearest-room queries
+    def __init__(self):
+        self._areas = {}
+        self._centers = {}
+        # bounds of the buckets in use, to know when a search can stop
+        self._extent = 0
+        self.count = 0
+
+    def add(self, room):
+        order = self.count
+        self.count += 1
+        for by in range(room.y1 / BUCKET_SIZE, room.y2 / BUCKET_SIZE + 1):
+            for bx in range(room.x1 / BUCKET_SIZE, room.x2 / BUCKET_SIZE + 1):
+                self._areas.setdefault((bx, by), []).append(room)
+        (x, y) = room.center()
+        self._centers.setdefault((x / BUCKET_SIZE, y / BUCKET_SIZE), []).append((order, room))
+        self._extent = max(self._extent, room.x2 / BUCKET_SIZE + 1, room.y2 / BUCKET_SIZE + 1)
+
+    def intersecting(self, rect):
+        # whether rect intersects (Rect.intersect) any of the rooms. two
+        # rooms that intersect share a point, and so a bucket
+        for by in range(rect.y1 / BUCKET_SIZE, rect.y2 / BUCKET_SIZE + 1):
+            for bx in range(rect.x1 / BUCKET_SIZE, rect.x2 / BUCKET_SIZE + 1):
+                for room in self._areas.get((bx, by), ()):
+                    if rect.intersect(room):
+                        return True
+        return False
+
+    def nearest(self, x, y, first=0):
+        # the room whose center is closest to (x, y), out of the rooms added
+        # from the `first` one on. ties go to the room added first, like a
+        # stable sort by distance would
+        (cx, cy) = (x / BUCKET_SIZE, y / BUCKET_SIZE)
+        best = None
+        best_key = None
+        ring = 0
+        while ring <= self._extent + max(abs(cx), abs(cy)):
+            for bucket in ring_buckets(cx, cy, ring):
+                for (order, room) in self._centers.get(bucket, ()):
+                    if order < first:
+                        continue
+                    (rx, ry) = room.center()
+                    key = ((rx - x) ** 2 + (ry - y) ** 2, order)
+                    if best_key is None or key < best_key:
+                        best = room
+                        best_key = key
+            # buckets further out are at least ring * BUCKET_SIZE away
+            if best_key is not None and best_key[0] < (ring * BUCKET_SIZE) ** 2:
+                break
+            ring += 1
+        return best
+
+
+def ring_buckets(cx, cy, ring):
+    # the buckets exactly `ring` buckets away from (cx, cy)
+    if ring == 0:
+        return [(cx, cy)]
+    buckets = []
+    for bx in range(cx - ring, cx + ring + 1):
+        buckets.append((bx, cy - ring))
+        buckets.append((bx, cy + ring))
+    for by in range(cy - ring + 1, cy + ring):
+        buckets.append((cx - ring, by))
+        buckets.append((cx + ring, by))
+    return buckets
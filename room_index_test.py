@@ -0,0 +1,41 @@
+import unittest
+import random
+import math
+from rect import Rect
+from room_index import RoomIndex
+
+class TestRoomIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.random = random.Random(3)
+        self.rooms = []
+        self.index = RoomIndex()
+        for _ in range(60):
+            room = Rect(self.random.randint(0, 150), self.random.randint(0, 90),
+                        self.random.randint(4, 20), self.random.randint(4, 20))
+            self.rooms.append(room)
+            self.index.add(room)
+
+    def test_intersecting_matches_a_full_scan(self):
+        for _ in range(500):
+            rect = Rect(self.random.randint(-5, 160), self.random.randint(-5, 100),
+                        self.random.randint(1, 20), self.random.randint(1, 20))
+            expected = any(rect.intersect(room) for room in self.rooms)
+            self.assertEqual(self.index.intersecting(rect), expected)
+
+    def test_nearest_matches_sorting(self):
+        for _ in range(500):
+            (x, y) = (self.random.randint(0, 170), self.random.randint(0, 110))
+
+            def distance(room):
+                (rx, ry) = room.center()
+                return math.sqrt((rx - x) ** 2 + (ry - y) ** 2)
+            expected = sorted(self.rooms[1:], key=distance)[0]
+            self.assertIs(self.index.nearest(x, y, first=1), expected)
+
+    def test_empty(self):
+        self.assertIsNone(RoomIndex().nearest(3, 3))
+        self.assertFalse(RoomIndex().intersecting(Rect(0, 0, 5, 5)))
+
+if __name__ == '__main__':
+    unittest.main()
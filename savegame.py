@@ -0,0 +1,632 @@
+import libtcodpy as libtcod
+from map import Map
+from object import Object
+from rect import Rect
+from components import Fighter, FighterStats, BasicMonster, AggroState, ConfusedMonster, Item, Ladder, Chest, Weapon, FISTS
+from templates import TEMPLATES, CALLBACKS
+import dungeon_generator  # registers the templates and callbacks saves refer to
+from array import array
+from constants import *
+import struct
+import sys
+import os
+import mmap
+
+# a save is MAGIC, the format version, the section count and an index of
+# the sections (a 4 byte tag, the offset and the length of each), then the
+# sections. readers only look up the sections they know
+MAGIC = b'SKYSPIRE'
+VERSION = 1
+
+# the fields of each kind of record, in file order. types are struct codes
+# (little endian), or one of:
+#   str       utf-8 text, prefixed with its length
+#   glyph     a tile code, or None
+#   color     r, g, b
+#   callback  the name of a registered callback, or None
+GAME_FIELDS = [('game_state', 'str'), ('player_index', 'I')]
+MESSAGE_FIELDS = [('text', 'str'), ('color', 'color')]
+MAP_FIELDS = [('w', 'H'), ('h', 'H'), ('floor', 'H'), ('torch_left', 'i')]
+ROOM_FIELDS = [('x1', 'h'), ('y1', 'h'), ('x2', 'h'), ('y2', 'h')]
+OBJECT_FIELDS = [('x', 'h'), ('y', 'h')]
+FIGHTER_FIELDS = [('xp', 'I'), ('hp', 'i'), ('weapon_name', 'str'), ('weapon_atk', 'h')]
+STATS_FIELDS = [('xp_gain', 'i'), ('hp_base', 'i'), ('power_base', 'i'), ('defense_base', 'i'),
+                ('striked_char', 'glyph'), ('death_function', 'callback'), ('speed', 'H')]
+BASIC_AI_FIELDS = [('aggro', '?'), ('atk_range', 'H')]
+CONFUSED_AI_FIELDS = [('num_turns', 'h')]
+
+# the tile planes, in file order
+PLANES = ['blocked', 'block_sight', 'explored', 'tunnel']
+
+# what an object record holds. objects made from a template only store the
+# looks that differ from it
+HAS_KIND = 1 << 0
+OWN_CHAR = 1 << 1
+OWN_NAME = 1 << 2
+OWN_COLOR = 1 << 3
+BLOCKS = 1 << 4
+HAS_FIGHTER = 1 << 5
+OWN_STATS = 1 << 6
+HAS_AI = 1 << 7
+HAS_ITEM = 1 << 8
+HAS_LADDER = 1 << 9
+HAS_CHEST = 1 << 10
+HAS_INVENTORY = 1 << 11
+
+AI_BASIC = 1
+AI_CONFUSED = 2
+
+NO_GLYPH = 0xffff
+
+
+# snapshots: the game as plain data (dicts, tuples, strings and numbers)
+# that shares nothing with the live objects
+
+def snapshot(map, player, game_msgs, game_state):
+    return {
+        'game_state': game_state,
+        'player_index': map._objects.index(player),
+        'messages': [{'text': text, 'color': color_tuple(color)} for (text, color) in game_msgs],
+        'map': {'w': map.w, 'h': map.h, 'floor': map.floor, 'torch_left': map.torch_left},
+        'rooms': [{'x1': r.x1, 'y1': r.y1, 'x2': r.x2, 'y2': r.y2} for r in map.rooms],
+        'tiles': tile_planes(map),
+        'objects': [object_record(o) for o in map._objects],
+    }
+
+
+def tile_planes(map):
+    tiles = map.tiles
+    if isinstance(tiles, list):
+        # savegames from before the tile grid kept a Tile per cell, by column
+        planes = dict((name, bytearray(map.w * map.h)) for name in PLANES)
+        xp_gain = array('H', [0] * (map.w * map.h))
+        for x in range(map.w):
+            for y in range(map.h):
+                tile = tiles[x][y]
+                i = x + y * map.w
+                for name in PLANES:
+                    planes[name][i] = 1 if getattr(tile, name) else 0
+                xp_gain[i] = tile.xp_gain
+    else:
+        planes = dict((name, getattr(tiles, name)) for name in PLANES)
+        xp_gain = tiles.xp_gain
+    data = dict((name, bytes(planes[name])) for name in PLANES)
+    if sys.byteorder == 'big':
+        xp_gain = array('H', xp_gain)
+        xp_gain.byteswap()
+    data['xp_gain'] = xp_gain.tostring()
+    return data
+
+
+def object_record(object):
+    # also reads the objects of old savegames, hence the fallbacks
+    kind = getattr(object, 'kind', None)
+    record = {
+        'kind': kind.id if kind is not None else None,
+        'x': object.x,
+        'y': object.y,
+        'char': glyph(object.chars[-1] if hasattr(object, 'chars') else object.char),
+        'name': object.name,
+        'color': color_tuple(object.color),
+        'blocks': bool(object.blocks),
+        'fighter': None,
+        'ai': None,
+        'item': None,
+        'ladder': None,
+        'chest': None,
+        'inventory': [object_record(o) for o in object_inventory(object)],
+    }
+    fighter = object.fighter
+    if fighter is not None:
+        record['fighter'] = {
+            'xp': fighter.xp,
+            'hp': fighter.hp,
+            'weapon_name': fighter.weapon.name,
+            'weapon_atk': fighter.weapon.atk,
+            'stats': stats_record(fighter, kind),
+        }
+    if object.ai is not None:
+        record['ai'] = ai_record(object.ai)
+    if object.item is not None:
+        record['item'] = {'use_function': callback_name(object.item.use_function)}
+    if object.ladder is not None:
+        record['ladder'] = {'use_function': callback_name(object.ladder.use_function)}
+    if object.chest is not None:
+        record['chest'] = [object_record(o) for o in object.chest.items if o is not None]
+    return record
+
+
+def object_inventory(object):
+    if hasattr(object, '_inventory'):
+        return object._inventory or []
+    return getattr(object, 'inventory', [])
+
+
+def stats_record(fighter, kind):
+    stats = getattr(fighter, 'stats', None)
+    if stats is not None and kind is not None and stats is getattr(kind, 'stats', None):
+        # shared with the template
+        return None
+    if stats is None:
+        stats = fighter
+    return {
+        'xp_gain': stats.xp_gain,
+        'hp_base': stats.hp_base,
+        'power_base': stats.power_base,
+        'defense_base': stats.defense_base,
+        'striked_char': glyph(stats.striked_char),
+        'death_function': callback_name(stats.death_function),
+        'speed': getattr(stats, 'speed', NORMAL_SPEED),
+    }
+
+
+def ai_record(ai):
+    if type(ai).__name__ == 'ConfusedMonster':
+        return {'type': AI_CONFUSED, 'num_turns': ai.num_turns, 'old_ai': ai_record(ai.old_ai)}
+    return {'type': AI_BASIC, 'aggro': type(ai.state).__name__ == 'AggroState', 'atk_range': ai.atk_range}
+
+
+def glyph(char):
+    if isinstance(char, basestring):
+        return ord(char)
+    return char
+
+
+def color_tuple(color):
+    return (color.r, color.g, color.b)
+
+
+def callback_name(function):
+    if function is None:
+        return None
+    if CALLBACKS.get(function.__name__) is None:
+        raise ValueError('Function ' + function.__name__ + ' is not a registered callback.')
+    return function.__name__
+
+
+def restore(data):
+    # the inverse of snapshot: returns (map, player, game_msgs, game_state)
+    info = data['map']
+    map = Map(info['w'], info['h'], info['floor'])
+    map.torch_left = info['torch_left']
+    for room in data['rooms']:
+        map.add_room(Rect(room['x1'], room['y1'], room['x2'] - room['x1'], room['y2'] - room['y1']))
+    tiles = data['tiles']
+    for name in PLANES:
+        plane = getattr(map.tiles, name)
+        if len(tiles[name]) != len(plane):
+            raise ValueError('Savegame tiles do not match the map size.')
+        plane[:] = tiles[name]
+    xp_gain = array('H')
+    xp_gain.fromstring(tiles['xp_gain'])
+    if sys.byteorder == 'big':
+        xp_gain.byteswap()
+    map.tiles.xp_gain = xp_gain
+    # the libtcod maps are built from the planes on first use
+    map.tiles.take_changes()
+    for record in data['objects']:
+        map.add_object(restore_object(record))
+    player = map._objects[data['player_index']]
+    game_msgs = [(m['text'], libtcod.Color(*m['color'])) for m in data['messages']]
+    return (map, player, game_msgs, data['game_state'])
+
+
+def restore_object(record):
+    kind = TEMPLATES[record['kind']] if record['kind'] is not None else None
+    fighter = None
+    if record['fighter'] is not None:
+        fighter = restore_fighter(record['fighter'], kind)
+    ai = None
+    if record['ai'] is not None:
+        ai = restore_ai(record['ai'])
+    item = None
+    if record['item'] is not None:
+        item = Item(use_function=restore_callback(record['item']['use_function']))
+    ladder = None
+    if record['ladder'] is not None:
+        ladder = Ladder(restore_callback(record['ladder']['use_function']))
+    chest = None
+    if record['chest'] is not None:
+        chest = Chest([restore_object(r) for r in record['chest']])
+    object = Object(record['x'], record['y'], record['char'], record['name'],
+                    libtcod.Color(*record['color']), blocks=record['blocks'], fighter=fighter,
+                    ai=ai, item=item, ladder=ladder, chest=chest, kind=kind)
+    if record['inventory']:
+        object.inventory.extend(restore_object(r) for r in record['inventory'])
+    # a confused monster hands its owner back to the AI it had before
+    while isinstance(ai, ConfusedMonster):
+        ai.old_ai.owner = object
+        ai = ai.old_ai
+    return object
+
+
+def restore_fighter(record, kind):
+    if record['stats'] is None:
+        stats = kind.stats
+    else:
+        stats = dict(record['stats'])
+        stats['death_function'] = restore_callback(stats['death_function'])
+        stats = FighterStats(**stats)
+    fighter = Fighter(xp=record['xp'], stats=stats)
+    fighter.hp = record['hp']
+    if (record['weapon_name'], record['weapon_atk']) != (FISTS.name, FISTS.atk):
+        fighter.weapon = Weapon(record['weapon_name'], record['weapon_atk'])
+    return fighter
+
+
+def restore_ai(record):
+    if record['type'] == AI_CONFUSED:
+        return ConfusedMonster(restore_ai(record['old_ai']), record['num_turns'])
+    ai = BasicMonster(atk_range=record['atk_range'])
+    if record['aggro']:
+        ai.state = AggroState(ai)
+    return ai
+
+
+def restore_callback(name):
+    if name is None:
+        return None
+    return CALLBACKS[name]
+
+
+# the binary format
+
+class Writer(object):
+    def __init__(self):
+        self.parts = []
+
+    def pack(self, fmt, *values):
+        self.parts.append(struct.pack('<' + fmt, *values))
+
+    def string(self, text):
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        self.pack('H', len(text))
+        self.parts.append(text)
+
+    def blob(self, data):
+        self.pack('I', len(data))
+        self.parts.append(data)
+
+    def fields(self, schema, record):
+        for (name, type) in schema:
+            value = record[name]
+            if type == 'str':
+                self.string(value)
+            elif type == 'glyph':
+                self.pack('H', NO_GLYPH if value is None else value)
+            elif type == 'color':
+                self.pack('BBB', *value)
+            elif type == 'callback':
+                self.string(value or '')
+            else:
+                self.pack(type, value)
+
+    def getvalue(self):
+        return b''.join(self.parts)
+
+
+class Reader(object):
+    # reads from a string or a memory mapped file, between offset and end
+    def __init__(self, data, offset=0, end=None):
+        self.data = data
+        self.offset = offset
+        self.end = len(data) if end is None else end
+
+    def unpack(self, fmt):
+        fmt = '<' + fmt
+        size = struct.calcsize(fmt)
+        if self.offset + size > self.end:
+            raise ValueError('Truncated savegame.')
+        values = struct.unpack_from(fmt, self.data, self.offset)
+        self.offset += size
+        return values
+
+    def string(self):
+        return self.bytes(self.unpack('H')[0])
+
+    def blob(self):
+        return self.bytes(self.unpack('I')[0])
+
+    def bytes(self, n):
+        if self.offset + n > self.end:
+            raise ValueError('Truncated savegame.')
+        data = self.data[self.offset:self.offset + n]
+        self.offset += n
+        return data
+
+    def view(self, n):
+        # like bytes, without copying: a buffer over the data
+        if self.offset + n > self.end:
+            raise ValueError('Truncated savegame.')
+        data = buffer(self.data, self.offset, n)
+        self.offset += n
+        return data
+
+    def fields(self, schema):
+        record = {}
+        for (name, type) in schema:
+            if type == 'str':
+                value = self.string()
+            elif type == 'glyph':
+                value = self.unpack('H')[0]
+                if value == NO_GLYPH:
+                    value = None
+            elif type == 'color':
+                value = self.unpack('BBB')
+            elif type == 'callback':
+                value = self.string() or None
+            else:
+                value = self.unpack(type)[0]
+            record[name] = value
+        return record
+
+
+def encode(data):
+    sections = []
+
+    w = Writer()
+    w.fields(GAME_FIELDS, data)
+    sections.append(('GAME', w))
+
+    w = Writer()
+    w.pack('H', len(data['messages']))
+    for m in data['messages']:
+        w.fields(MESSAGE_FIELDS, m)
+    sections.append(('MSGS', w))
+
+    w = Writer()
+    w.fields(MAP_FIELDS, data['map'])
+    w.pack('H', len(data['rooms']))
+    for room in data['rooms']:
+        w.fields(ROOM_FIELDS, room)
+    sections.append(('MAP ', w))
+
+    w = Writer()
+    for name in PLANES + ['xp_gain']:
+        w.blob(data['tiles'][name])
+    sections.append(('TILE', w))
+
+    w = Writer()
+    write_objects(w, data['objects'])
+    sections.append(('OBJS', w))
+
+    payloads = [(tag, w.getvalue()) for (tag, w) in sections]
+    out = Writer()
+    out.parts.append(MAGIC)
+    out.pack('HH', VERSION, len(payloads))
+    offset = len(MAGIC) + 4 + 12 * len(payloads)
+    for (tag, payload) in payloads:
+        out.parts.append(tag)
+        out.pack('II', offset, len(payload))
+        offset += len(payload)
+    out.parts.extend(payload for (tag, payload) in payloads)
+    return out.getvalue()
+
+
+def write_objects(w, records):
+    w.pack('I', len(records))
+    for record in records:
+        write_object(w, record)
+
+
+def write_object(w, record):
+    kind = TEMPLATES[record['kind']] if record['kind'] is not None else None
+    flags = 0
+    if kind is not None:
+        flags |= HAS_KIND
+    if kind is None or record['char'] != glyph(kind.char):
+        flags |= OWN_CHAR
+    if kind is None or record['name'] != kind.name:
+        flags |= OWN_NAME
+    if kind is None or record['color'] != color_tuple(kind.color):
+        flags |= OWN_COLOR
+    if record['blocks']:
+        flags |= BLOCKS
+    fighter = record['fighter']
+    if fighter is not None:
+        flags |= HAS_FIGHTER
+        if fighter['stats'] is not None:
+            flags |= OWN_STATS
+    for (key, flag) in [('ai', HAS_AI), ('item', HAS_ITEM), ('ladder', HAS_LADDER), ('chest', HAS_CHEST)]:
+        if record[key] is not None:
+            flags |= flag
+    if record['inventory']:
+        flags |= HAS_INVENTORY
+
+    w.pack('H', flags)
+    if flags & HAS_KIND:
+        w.string(record['kind'])
+    w.fields(OBJECT_FIELDS, record)
+    if flags & OWN_CHAR:
+        w.fields([('char', 'glyph')], record)
+    if flags & OWN_NAME:
+        w.string(record['name'])
+    if flags & OWN_COLOR:
+        w.pack('BBB', *record['color'])
+    if flags & HAS_FIGHTER:
+        w.fields(FIGHTER_FIELDS, fighter)
+        if flags & OWN_STATS:
+            w.fields(STATS_FIELDS, fighter['stats'])
+    if flags & HAS_AI:
+        write_ai(w, record['ai'])
+    if flags & HAS_ITEM:
+        w.fields([('use_function', 'callback')], record['item'])
+    if flags & HAS_LADDER:
+        w.fields([('use_function', 'callback')], record['ladder'])
+    if flags & HAS_CHEST:
+        write_objects(w, record['chest'])
+    if flags & HAS_INVENTORY:
+        write_objects(w, record['inventory'])
+
+
+def write_ai(w, ai):
+    w.pack('B', ai['type'])
+    if ai['type'] == AI_CONFUSED:
+        w.fields(CONFUSED_AI_FIELDS, ai)
+        write_ai(w, ai['old_ai'])
+    else:
+        w.fields(BASIC_AI_FIELDS, ai)
+
+
+def decode(data):
+    # data is a string or a memory mapped file. the tile planes come back
+    # as buffers over it
+    sections = section_index(data)
+
+    def section(tag):
+        (offset, length) = sections[tag]
+        return Reader(data, offset, offset + length)
+
+    result = {}
+    r = section('GAME')
+    result.update(r.fields(GAME_FIELDS))
+
+    r = section('MSGS')
+    result['messages'] = [r.fields(MESSAGE_FIELDS) for _ in range(r.unpack('H')[0])]
+
+    r = section('MAP ')
+    result['map'] = r.fields(MAP_FIELDS)
+    result['rooms'] = [r.fields(ROOM_FIELDS) for _ in range(r.unpack('H')[0])]
+
+    r = section('TILE')
+    result['tiles'] = dict((name, r.view(r.unpack('I')[0])) for name in PLANES + ['xp_gain'])
+
+    result['objects'] = read_objects(section('OBJS'))
+    return result
+
+
+def section_index(data):
+    # returns the {tag: (offset, length)} of the sections
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('Not a savegame.')
+    r = Reader(data, len(MAGIC))
+    (version,) = r.unpack('H')
+    if version > VERSION:
+        raise ValueError('The savegame is from a newer version of the game (format %d).' % version)
+    sections = {}
+    for _ in range(r.unpack('H')[0]):
+        tag = r.bytes(4)
+        sections[tag] = r.unpack('II')
+    for (offset, length) in sections.values():
+        if offset + length > len(data):
+            raise ValueError('Truncated savegame.')
+    return sections
+
+
+def read_objects(r):
+    return [read_object(r) for _ in range(r.unpack('I')[0])]
+
+
+def read_object(r):
+    (flags,) = r.unpack('H')
+    kind = None
+    if flags & HAS_KIND:
+        kind = TEMPLATES[r.string()]
+    record = r.fields(OBJECT_FIELDS)
+    record['kind'] = kind.id if kind is not None else None
+    record['char'] = r.fields([('char', 'glyph')])['char'] if flags & OWN_CHAR else glyph(kind.char)
+    record['name'] = r.string() if flags & OWN_NAME else kind.name
+    record['color'] = r.unpack('BBB') if flags & OWN_COLOR else color_tuple(kind.color)
+    record['blocks'] = bool(flags & BLOCKS)
+    record['fighter'] = None
+    if flags & HAS_FIGHTER:
+        fighter = r.fields(FIGHTER_FIELDS)
+        fighter['stats'] = r.fields(STATS_FIELDS) if flags & OWN_STATS else None
+        record['fighter'] = fighter
+    record['ai'] = read_ai(r) if flags & HAS_AI else None
+    record['item'] = r.fields([('use_function', 'callback')]) if flags & HAS_ITEM else None
+    record['ladder'] = r.fields([('use_function', 'callback')]) if flags & HAS_LADDER else None
+    record['chest'] = read_objects(r) if flags & HAS_CHEST else None
+    record['inventory'] = read_objects(r) if flags & HAS_INVENTORY else []
+    return record
+
+
+def read_ai(r):
+    (type,) = r.unpack('B')
+    if type == AI_CONFUSED:
+        ai = r.fields(CONFUSED_AI_FIELDS)
+        ai['old_ai'] = read_ai(r)
+    else:
+        ai = r.fields(BASIC_AI_FIELDS)
+    ai['type'] = type
+    return ai
+
+
+# savegames from before this format were the whole game pickled with dill
+
+GAME_MODULES = set(['map', 'object', 'components', 'rect', 'tile_grid', 'templates',
+                    'room_index', 'scheduler', 'renderer', 'native'])
+
+
+class Legacy(object):
+    # stands in for the game's classes when reading an old savegame, so the
+    # old objects only have to carry their attributes, whatever they were
+    def __init__(self, *args):
+        pass
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            # slotted classes: (__dict__, slots)
+            for part in state:
+                if part:
+                    self.__dict__.update(part)
+        else:
+            self.__dict__.update(state)
+
+
+def legacy_class(name):
+    return type(name, (Legacy,), {})
+
+
+def load_legacy(file):
+    import dill
+    classes = {}
+
+    class LegacyUnpickler(dill.Unpickler):
+        def find_class(self, module, name):
+            if module in GAME_MODULES:
+                real = getattr(sys.modules.get(module), name, None)
+                if real is None or isinstance(real, type) or type(real).__name__ == 'classobj':
+                    if (module, name) not in classes:
+                        classes[(module, name)] = legacy_class(name)
+                    return classes[(module, name)]
+            return dill.Unpickler.find_class(self, module, name)
+
+    data = LegacyUnpickler(file).load()
+    map = data['map']
+    player = map._objects[data['player_index']]
+    return snapshot(map, player, data['game_msgs'], data['game_state'])
+
+
+def write(path, data):
+    # write through a temporary file and rename it over the save, so a crash
+    # midway leaves the previous save intact
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    if os.name == 'nt' and os.path.exists(path):
+        # rename doesn't replace files on windows
+        os.remove(path)
+    os.rename(temporary, path)
+
+
+def save(path, map, player, game_msgs, game_state):
+    write(path, encode(snapshot(map, player, game_msgs, game_state)))
+
+
+def load(path):
+    # returns (map, player, game_msgs, game_state)
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            file.seek(0)
+            return restore(load_legacy(file))
+        # map the file instead of reading it: the tile planes are copied
+        # straight from the mapping into the map
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return restore(decode(mapping))
+    finally:
+        mapping.close()
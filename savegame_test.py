@@ -0,0 +1,108 @@
+import unittest
+import os
+import tempfile
+import libtcodpy as libtcod
+import savegame
+from map import Map
+from object import Object
+from components import Fighter, Item, ConfusedMonster, AggroState
+from dungeon_generator import DungeonGenerator, ORC, HEALING_POTION, monster_death
+from constants import *
+import sounds
+import tiles
+
+def new_game():
+    fighter = Fighter(power_base=13, defense_base=5, death_function=monster_death)
+    player = Object(0, 0, tiles.player_tile, 'player', libtcod.white, blocks=True, fighter=fighter)
+    map = Map(MAP_WIDTH, MAP_HEIGHT, 2)
+    map.add_object(player)
+    DungeonGenerator(7).generate(map, player)
+    return (map, player)
+
+class TestSavegame(unittest.TestCase):
+
+    def setUp(self):
+        sounds.enabled = False
+
+    def test_round_trip(self):
+        (map, player) = new_game()
+        player.inventory.append(HEALING_POTION.spawn(0, 0))
+        player.fighter.xp = 250
+        monsters = [o for o in map._objects if o.ai is not None]
+        monsters[0].ai.state = AggroState(monsters[0].ai)
+        monsters[1].ai = ConfusedMonster(monsters[1].ai, 3)
+        monsters[1].ai.owner = monsters[1]
+        monster_death(monsters[2])
+        map.tile_at(3, 3).explored = True
+        msgs = [('Hello', libtcod.Color(0, 255, 0))]
+
+        data = savegame.encode(savegame.snapshot(map, player, msgs, 'playing'))
+        (loaded, loaded_player, loaded_msgs, state) = savegame.restore(savegame.decode(data))
+
+        self.assertEqual(state, 'playing')
+        self.assertEqual([(text, (c.r, c.g, c.b)) for (text, c) in loaded_msgs], [('Hello', (0, 255, 0))])
+        self.assertEqual(loaded.floor, 2)
+        self.assertEqual(str(loaded.tiles.blocked), str(map.tiles.blocked))
+        self.assertTrue(loaded.tile_at(3, 3).explored)
+        self.assertEqual(list(loaded.tiles.xp_gain), list(map.tiles.xp_gain))
+        self.assertEqual(len(loaded.rooms), len(map.rooms))
+        self.assertEqual([(o.name, o.x, o.y, o.char, o.blocks) for o in loaded._objects],
+                         [(o.name, o.x, o.y, o.char, o.blocks) for o in map._objects])
+        self.assertIs(loaded_player, loaded._objects[map._objects.index(player)])
+        self.assertEqual(loaded_player.fighter.level(), player.fighter.level())
+        self.assertIs(loaded_player.fighter.stats.death_function, monster_death)
+        self.assertEqual([o.name for o in loaded_player.inventory], ['healing potion'])
+
+        loaded_monsters = [o for o in loaded._objects if o.ai is not None]
+        self.assertIs(loaded_monsters[0].kind, monsters[0].kind)
+        self.assertIs(loaded_monsters[0].fighter.stats, monsters[0].kind.stats)
+        self.assertIsInstance(loaded_monsters[0].ai.state, AggroState)
+        self.assertEqual(loaded_monsters[1].ai.num_turns, 3)
+        self.assertIs(loaded_monsters[1].ai.old_ai.owner, loaded_monsters[1])
+        # the corpse keeps its own looks
+        corpse = [o for o in loaded._objects if o.name.startswith('remains of')]
+        self.assertEqual(len(corpse), 1)
+        self.assertEqual(corpse[0].char, tiles.tomb_tile)
+
+        # and the restored game is playable
+        loaded.fov_recompute(loaded_player)
+        loaded.take_monster_turns(loaded_player)
+
+    def test_load_from_file(self):
+        (map, player) = new_game()
+        (handle, path) = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            savegame.save(path, map, player, [], 'playing')
+            (loaded, loaded_player, msgs, state) = savegame.load(path)
+        finally:
+            os.remove(path)
+        self.assertEqual(str(loaded.tiles.explored), str(map.tiles.explored))
+        self.assertEqual((loaded_player.x, loaded_player.y), (player.x, player.y))
+
+    def test_truncated_saves_are_refused(self):
+        (map, player) = new_game()
+        data = savegame.encode(savegame.snapshot(map, player, [], 'playing'))
+        self.assertRaises(ValueError, savegame.decode, data[:len(data) - 10])
+
+    def test_newer_versions_are_refused(self):
+        (map, player) = new_game()
+        data = savegame.encode(savegame.snapshot(map, player, [], 'playing'))
+        data = savegame.MAGIC + '\xff\xff' + data[len(savegame.MAGIC) + 2:]
+        self.assertRaises(ValueError, savegame.decode, data)
+
+    def test_legacy_objects(self):
+        # the attributes an object pickled by older versions comes back with
+        legacy = savegame.legacy_class('Object')()
+        legacy.__setstate__({'x': 3, 'y': 4, 'chars': [tiles.striked_orc_tile, tiles.orc_tile],
+                             'name': 'orc', 'color': libtcod.white, 'blocks': True,
+                             'fighter': None, 'ai': None, 'item': None, 'ladder': None,
+                             'chest': None, 'inventory': []})
+        record = savegame.object_record(legacy)
+        self.assertEqual(record['char'], tiles.orc_tile)
+        self.assertIsNone(record['kind'])
+        object = savegame.restore_object(record)
+        self.assertEqual((object.x, object.y, object.name), (3, 4, 'orc'))
+
+if __name__ == '__main__':
+    unittest.main()
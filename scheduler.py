@@ -0,0 +1,113 @@
+import heapq
+from constants import *
+from components import IdleState
+from envparse import env
+
+# game time a player turn takes. an actor with NORMAL_SPEED acts once per
+# player turn, one with twice that speed acts twice
+TURN_TIME = 100
+# the simulation bubble. idle actors further than the radius (plus a margin,
+# so they don't flip back and forth) from the player are parked, and parked
+# ones come back once the player is within it. it is a square radius, and
+# should be larger than the torch so nothing freezes in view
+SIMULATION_RADIUS = env.int('SIMULATION_RADIUS', default=TORCH_RADIUS + 2)
+PARK_MARGIN = 4
+# when a parked actor comes back, it makes up for at most this many of the
+# turns it missed in one cheap batch. 0 leaves parked actors frozen
+CATCH_UP_TURNS = env.int('CATCH_UP_TURNS', default=20)
+# how long woken actors stay awake before they can be parked again
+AWAKE_TIME = 10 * TURN_TIME
+
+
+def action_time(object):
+    # game time between two actions of the given actor
+    speed = NORMAL_SPEED
+    if object.fighter is not None:
+        speed = object.fighter.stats.speed
+    return TURN_TIME * NORMAL_SPEED / speed
+
+
+def square_distance(object, x, y):
+    return max(abs(object.x - x), abs(object.y - y))
+
+
+class Scheduler(object):
+    # decides which actors of a map act, and when. awake actors wait in a
+    # priority queue keyed by the time of their next action, so each player
+    # turn only touches the actors due in it. idle actors far from the player
+    # are parked outside the queue until the player comes close or a noise
+    # wakes them up
+    def __init__(self, map, radius=SIMULATION_RADIUS, catch_up_turns=CATCH_UP_TURNS):
+        self.map = map
+        self.radius = radius
+        self.catch_up_turns = catch_up_turns
+        self.time = 0
+        # (time, order, actor). order keeps actors due at the same time in the
+        # order they were queued
+        self._queue = []
+        self._order = 0
+        self._queued = set()
+        # parked actor -> time it was parked
+        self.parked = {}
+        # woken actor -> time it can be parked again
+        self._awake_until = {}
+        for object in map._objects:
+            self.add(object)
+
+    def add(self, object):
+        if object.ai is None or object in self._queued or object in self.parked:
+            return
+        self._push(object, self.time)
+
+    def _push(self, object, time):
+        self._queued.add(object)
+        heapq.heappush(self._queue, (time, self._order, object))
+        self._order += 1
+
+    def _is_gone(self, object):
+        # dead, or taken off the map
+        return object.ai is None or object.map is not self.map
+
+    def wake(self, object):
+        if object in self.parked:
+            parked_at = self.parked.pop(object)
+            if not self._is_gone(object):
+                self._catch_up(object, parked_at)
+                self._awake_until[object] = self.time + AWAKE_TIME
+                self._push(object, self.time)
+
+    def _catch_up(self, object, parked_at):
+        state = getattr(object.ai, 'state', None)
+        turns = min((self.time - parked_at) / action_time(object), self.catch_up_turns)
+        if turns > 0 and isinstance(state, IdleState):
+            state.catch_up(self.map, turns)
+
+    def wake_within(self, x, y, radius):
+        for object in [o for o in self.parked if square_distance(o, x, y) <= radius]:
+            self.wake(object)
+
+    def should_park(self, object, player):
+        if self._awake_until.get(object, 0) > self.time:
+            return False
+        state = getattr(object.ai, 'state', None)
+        return isinstance(state, IdleState) and square_distance(object, player.x, player.y) > self.radius + PARK_MARGIN
+
+    def run_turn(self, player):
+        # let every actor due before the end of this player turn act
+        end = self.time + TURN_TIME
+        self.wake_within(player.x, player.y, self.radius)
+        while self._queue and self._queue[0][0] < end:
+            (time, _, object) = heapq.heappop(self._queue)
+            self._queued.discard(object)
+            if self._is_gone(object):
+                self._awake_until.pop(object, None)
+                continue
+            if self.should_park(object, player):
+                self._awake_until.pop(object, None)
+                self.parked[object] = time
+                continue
+            self.time = time
+            object.ai.take_turn(self.map, player)
+            if not self._is_gone(object):
+                self._push(object, time + action_time(object))
+        self.time = end
@@ -0,0 +1,109 @@
+import unittest
+import itertools
+import libtcodpy as libtcod
+from map import Map
+from object import Object
+from components import Fighter, FighterStats, IdleState
+from scheduler import Scheduler
+from constants import *
+
+class CountingAI:
+    # stays idle and counts its turns
+    def __init__(self):
+        self.owner = None
+        self.state = IdleState(self)
+        self.turns = 0
+
+    def take_turn(self, map, player):
+        self.turns += 1
+
+def monster(x, y, speed=NORMAL_SPEED):
+    fighter = Fighter(stats=FighterStats(speed=speed))
+    return Object(x, y, 'o', 'orc', libtcod.white, blocks=True, fighter=fighter, ai=CountingAI())
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.map = Map(80, 45, 1)
+        self.map.tiles.fill_rect(0, 0, 80, 45, False)
+        self.player = Object(2, 2, '@', 'player', libtcod.white, blocks=True, fighter=Fighter())
+        self.map.add_object(self.player)
+
+    def test_speed(self):
+        slow = monster(3, 3, NORMAL_SPEED / 2)
+        normal = monster(4, 4)
+        fast = monster(5, 5, NORMAL_SPEED * 2)
+        for object in [slow, normal, fast]:
+            self.map.add_object(object)
+        for _ in range(4):
+            self.map.take_monster_turns(self.player)
+        self.assertEqual([slow.ai.turns, normal.ai.turns, fast.ai.turns], [2, 4, 8])
+
+    def test_far_idle_monsters_are_parked(self):
+        far = monster(70, 40)
+        self.map.add_object(far)
+        self.map.take_monster_turns(self.player)
+        self.map.take_monster_turns(self.player)
+        self.assertEqual(far.ai.turns, 0)
+        self.assertIn(far, self.map.scheduler.parked)
+        # the player walking up wakes it
+        self.map.move_object(self.player, 65, 38)
+        self.map.take_monster_turns(self.player)
+        self.assertEqual(far.ai.turns, 1)
+
+    def test_noise_wakes_parked_monsters(self):
+        far = monster(70, 40)
+        self.map.add_object(far)
+        self.map.take_monster_turns(self.player)
+        self.map.noise(60, 40, 10)
+        self.map.take_monster_turns(self.player)
+        self.map.take_monster_turns(self.player)
+        self.assertEqual(far.ai.turns, 2)
+
+    def test_frozen_without_catch_up(self):
+        self.map.scheduler = Scheduler(self.map, radius=5, catch_up_turns=0)
+        far = monster(20, 20)
+        self.map.add_object(far)
+        for _ in range(10):
+            self.map.take_monster_turns(self.player)
+        self.assertEqual(far.ai.turns, 0)
+        self.map.move_object(self.player, 16, 20)
+        self.map.take_monster_turns(self.player)
+        self.assertEqual(far.ai.turns, 1)
+        self.assertEqual((far.x, far.y), (20, 20))
+
+    def test_catch_up_stays_on_open_tiles(self):
+        # a corridor along y = 20
+        self.map.tiles.fill_rect(0, 0, 80, 45, True)
+        self.map.tiles.fill_rect(10, 20, 60, 21, False)
+        self.map.scheduler = Scheduler(self.map, radius=5, catch_up_turns=30)
+        far = monster(30, 20)
+        self.map.add_object(far)
+        for _ in range(40):
+            self.map.take_monster_turns(self.player)
+        # the walk alternates a step east with a step south, into the wall
+        rolls = itertools.cycle([1, 1, 0, 1])
+        random_get_int = libtcod.random_get_int
+        libtcod.random_get_int = lambda rng, low, high: next(rolls)
+        try:
+            self.map.move_object(self.player, 30, 24)
+            self.map.take_monster_turns(self.player)
+        finally:
+            libtcod.random_get_int = random_get_int
+        self.assertEqual(far.ai.turns, 1)
+        # 30 turns of catching up, half of them blocked
+        self.assertEqual((far.x, far.y), (45, 20))
+        self.assertIn(far, self.map.objects_at(45, 20))
+
+    def test_dead_monsters_leave_the_queue(self):
+        orc = monster(3, 3)
+        self.map.add_object(orc)
+        self.map.take_monster_turns(self.player)
+        ai = orc.ai
+        orc.ai = None
+        self.map.take_monster_turns(self.player)
+        self.assertEqual(ai.turns, 1)
+        self.assertEqual(self.map.scheduler._queue, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,191 @@
 import analytics
 import uuid
 import os
+import json
+import time
+import threading
+from datetime import datetime, timedelta, tzinfo
+from envparse import env
 
 user_id = None
 tracking = False
 
+# events that couldn't be sent wait here for the next run, one json per line
+SPOOL_FILE = 'analytics_spool'
+# seconds between two batches of events
+FLUSH_INTERVAL = env.int('ANALYTICS_FLUSH_INTERVAL', default=10)
+# where the events go, e.g. a local stand-in server. the default is segment's
+HOST = env.str('ANALYTICS_HOST', default=None)
+# seconds quitting waits for a batch that is being sent
+CLOSE_TIMEOUT = 1
+
+class UTC(tzinfo):
+  def utcoffset(self, dt):
+    return timedelta(0)
+
+  def tzname(self, dt):
+    return 'UTC'
+
+  def dst(self, dt):
+    return timedelta(0)
+
+class EventQueue(object):
+  # events waiting to be sent. put only appends to a list, a background
+  # thread takes the events every `interval` seconds, merges repeats of the
+  # same event into one with a count, and sends them. the events that fail,
+  # or are still waiting when the queue closes, go to the spool file
+  def __init__(self, send, spool_file=SPOOL_FILE, interval=FLUSH_INTERVAL):
+    self.send = send
+    self.spool_file = spool_file
+    self.interval = interval
+    # (name, properties, time, count)
+    self._events = []
+    self._condition = threading.Condition()
+    self._closed = False
+    self._thread = None
+    # the batch being sent, until the send returns
+    self._sending = None
+
+  def put(self, event_name, properties, count=1, when=None):
+    with self._condition:
+      if when is None:
+        when = time.time()
+      self._events.append((event_name, properties, when, count))
+      if (self._thread is None or not self._thread.is_alive()) and not self._closed:
+        self._thread = threading.Thread(target=self._run, name='analytics')
+        self._thread.daemon = True
+        self._thread.start()
+
+  def take(self):
+    with self._condition:
+      (events, self._events) = (self._events, [])
+    return events
+
+  def flush(self):
+    events = self.take()
+    if not events:
+      return
+    with self._condition:
+      self._sending = events
+    try:
+      failed = self.send(coalesce(events))
+    except Exception:
+      # the client broke down: keep the whole batch for later
+      failed = events
+    with self._condition:
+      if self._sending is None:
+        # close gave up waiting and spooled the batch already
+        return
+      self._sending = None
+    if failed:
+      self.spool(failed)
+
+  def close(self):
+    # stops the thread and spools the events that are still waiting instead
+    # of sending them. a batch being sent gets CLOSE_TIMEOUT seconds to
+    # finish, after that it is spooled too, in case it doesn't make it
+    with self._condition:
+      self._closed = True
+      self._condition.notify_all()
+    if self._thread is not None:
+      self._thread.join(CLOSE_TIMEOUT)
+      self._thread = None
+    with self._condition:
+      events = self._events
+      if self._sending is not None:
+        events = self._sending + events
+        self._sending = None
+      self._events = []
+    self.spool(coalesce(events))
+
+  def spool(self, events):
+    if not events:
+      return
+    file = open(self.spool_file, 'a')
+    for (name, properties, when, count) in events:
+      file.write(json.dumps({'event': name, 'properties': properties,
+                             'time': when, 'count': count}) + '\n')
+    file.close()
+
+  def unspool(self):
+    # queues the events a previous run couldn't send
+    if not os.path.isfile(self.spool_file):
+      return
+    file = open(self.spool_file, 'r')
+    lines = file.readlines()
+    file.close()
+    os.remove(self.spool_file)
+    for line in lines:
+      try:
+        event = json.loads(line)
+      except ValueError:
+        # cut short when the game was killed
+        continue
+      self.put(event['event'], event['properties'], event['count'], event['time'])
+
+  def _run(self):
+    while True:
+      with self._condition:
+        if not self._closed:
+          self._condition.wait(self.interval)
+        if self._closed:
+          return
+      try:
+        self.flush()
+      except Exception:
+        # e.g. the spool file can't be written. the events are lost, but
+        # the thread lives on for the next ones
+        pass
+
+def coalesce(events):
+  # one event per name and properties, counting the repeats, at the time
+  # of the first
+  merged = {}
+  order = []
+  for (name, properties, when, count) in events:
+    key = (name, tuple(sorted(properties.items())))
+    if key in merged:
+      (_, _, first, total) = merged[key]
+      merged[key] = (name, properties, min(first, when), total + count)
+    else:
+      merged[key] = (name, properties, when, count)
+      order.append(key)
+  return [merged[key] for key in order]
+
+# the events handed to the analytics client and not uploaded yet, by
+# message id, so upload errors can put them back in the spool
+in_flight = {}
+failed = []
+
+def on_error(error, items):
+  for item in items:
+    event = in_flight.get(item.get('messageId'))
+    if event is not None:
+      failed.append(event)
+
+def send_to_segment(events):
+  # returns the events that couldn't be uploaded
+  del failed[:]
+  for event in events:
+    (name, properties, when, count) = event
+    message_id = str(uuid.uuid4())
+    in_flight[message_id] = event
+    properties = dict(properties, count=count)
+    analytics.track(user_id, name, properties,
+                    timestamp=datetime.fromtimestamp(when, UTC()), message_id=message_id)
+  # waits for the upload, errors included
+  analytics.flush()
+  in_flight.clear()
+  return list(failed)
+
+events = EventQueue(send_to_segment)
+
 def init_tracking(menu_fn):
   global tracking, user_id
   analytics.write_key = 'xGsvnwEpB4Au5l7gVa6BNjUmgqX9Bp3s'
+  analytics.on_error = on_error
+  if HOST is not None:
+    analytics.host = HOST
 
   if os.path.isfile('analytics_uuid'):
     file = open('analytics_uuid', 'r')
@@ -31,7 +209,15 @@ def init_tracking(menu_fn):
       file.write('true')
       file.close()
 
+  if tracking:
+    events.unspool()
+
 def track(event_name, properties = {}):
   if not tracking:
     return
-  analytics.track(user_id, event_name, properties)
+  events.put(event_name, properties)
+
+def stop_tracking():
+  # call before quitting: keeps the unsent events for the next run
+  if tracking:
+    events.close()
@@ -0,0 +1,109 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+import time
+import segment
+from segment import EventQueue, coalesce
+
+class TestEventQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.spool_file = os.path.join(self.directory, 'analytics_spool')
+        self.sent = []
+        self.failing = False
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def send(self, events):
+        if self.failing:
+            return events
+        self.sent.extend(events)
+        return []
+
+    def queue(self):
+        # an interval long enough that only the test flushes
+        return EventQueue(self.send, self.spool_file, interval=3600)
+
+    def test_coalesce(self):
+        events = coalesce([('Orc Defeated', {'level': 1}, 5.0, 1),
+                           ('Player Leveled Up', {'level': 2}, 6.0, 1),
+                           ('Orc Defeated', {'level': 1}, 7.0, 1),
+                           ('Orc Defeated', {'level': 2}, 8.0, 1),
+                           ('Orc Defeated', {'level': 1}, 4.0, 3)])
+        self.assertEqual(events, [('Orc Defeated', {'level': 1}, 4.0, 5),
+                                  ('Player Leveled Up', {'level': 2}, 6.0, 1),
+                                  ('Orc Defeated', {'level': 2}, 8.0, 1)])
+
+    def test_flush_sends_batches(self):
+        queue = self.queue()
+        for _ in range(3):
+            queue.put('Orc Defeated', {'level': 1})
+        queue.put('Started Game', {})
+        queue.flush()
+        self.assertEqual([(name, count) for (name, properties, when, count) in self.sent],
+                         [('Orc Defeated', 3), ('Started Game', 1)])
+        queue.close()
+        self.assertFalse(os.path.exists(self.spool_file))
+
+    def test_unsent_events_are_spooled(self):
+        queue = self.queue()
+        self.failing = True
+        queue.put('Orc Defeated', {'level': 1})
+        queue.flush()
+        queue.put('Orc Defeated', {'level': 1}, when=1.0)
+        queue.close()
+        self.assertEqual(self.sent, [])
+
+        # the next run sends them
+        self.failing = False
+        queue = self.queue()
+        queue.unspool()
+        self.assertFalse(os.path.exists(self.spool_file))
+        queue.flush()
+        self.assertEqual(self.sent, [('Orc Defeated', {'level': 1}, 1.0, 2)])
+        queue.close()
+
+    def test_send_errors_spool_the_batch(self):
+        def send(events):
+            raise IOError('connection refused')
+        queue = EventQueue(send, self.spool_file, interval=3600)
+        queue.put('Started Game', {}, when=1.0)
+        queue.flush()
+        queue.put('Loaded Game', {}, when=2.0)
+        queue.close()
+
+        queue = self.queue()
+        queue.unspool()
+        queue.flush()
+        self.assertEqual([name for (name, properties, when, count) in self.sent],
+                         ['Started Game', 'Loaded Game'])
+        queue.close()
+
+    def test_close_does_not_wait_for_a_stuck_send(self):
+        release = threading.Event()
+
+        def send(events):
+            # like the client retrying while offline
+            release.wait(10)
+            return []
+        queue = EventQueue(send, self.spool_file, interval=0.01)
+        queue.put('Orc Defeated', {'level': 1}, when=1.0)
+        while queue._sending is None:
+            time.sleep(0.01)
+        start = time.time()
+        queue.close()
+        self.assertLess(time.time() - start, segment.CLOSE_TIMEOUT + 1)
+        release.set()
+
+        queue = self.queue()
+        queue.unspool()
+        queue.flush()
+        self.assertEqual(self.sent, [('Orc Defeated', {'level': 1}, 1.0, 1)])
+        queue.close()
+
+if __name__ == '__main__':
+    unittest.main()
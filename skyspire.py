@@ -8,25 +8,46 @@ from colors import *
 from dungeon_generator import DungeonGenerator
 from envparse import env
 from sounds import play_sound
+import sounds
 import tiles
-import dill
+import savegame
+from autosave import Autosaver
 import os.path
 from collections import defaultdict
-from segment import init_tracking, track
+from segment import init_tracking, track, stop_tracking
+from native import Console
+from templates import callback
 
-libtcod.console_set_custom_font(
-    'sprites.png', libtcod.FONT_LAYOUT_ASCII_INROW)
-libtcod.console_init_root(SCREEN_WIDTH, SCREEN_HEIGHT,
-                          'python/libtcod tutorial', False)
-con = libtcod.console_new(MAP_WIDTH, MAP_HEIGHT)
-libtcod.sys_set_fps(LIMIT_FPS)
-
-panel = libtcod.console_new(SCREEN_WIDTH, PANEL_HEIGHT)
+# off-screen consoles for the map and the GUI panel, created by init_console.
+# they stay None when the game runs headless
+con = None
+panel = None
 
 generator = DungeonGenerator(env.int('SEED', default=None))
 
+map = None
+# writes the savegame in the background, on exit and every few turns
+autosaver = Autosaver('savegame')
+# what the GUI panel showed when it was last drawn
+panel_drawn = None
+
+
+def init_console():
+    global con, panel
+    libtcod.console_set_custom_font(
+        'sprites.png', libtcod.FONT_LAYOUT_ASCII_INROW)
+    libtcod.console_init_root(SCREEN_WIDTH, SCREEN_HEIGHT,
+                              'python/libtcod tutorial', False)
+    con = libtcod.console_new(MAP_WIDTH, MAP_HEIGHT)
+    libtcod.sys_set_fps(LIMIT_FPS)
+
+    panel = libtcod.console_new(SCREEN_WIDTH, PANEL_HEIGHT)
+    # decode the sound effects now rather than in the middle of a fight
+    sounds.preload()
+
 
 def keep_savegame():
+    autosaver.flush()
     if os.path.isfile('savegame'):
         header = 'Overwrite existing game?'
         options = ['No', 'Yes']
@@ -52,6 +73,7 @@ def new_game():
     message('Welcome stranger! The tower is eager for your soul.', color_red)
     track('Started Game')
 
+@callback
 def player_death(player):
     # the game ended!
     global game_state
@@ -59,21 +81,24 @@ def player_death(player):
     game_state = 'dead'
 
     # for added effect, transform the player into a corpse!
-    player.chars = [tiles.playertomb_tile]
+    player.set_char(tiles.playertomb_tile)
     play_sound('Dead.wav')
 
 def make_map(floor=1,**kargs):
     global map
 
-    # the list of objects with just the player
+    # the floor being left won't be used again
+    if map is not None:
+        map.release()
 
     map = Map(MAP_WIDTH, MAP_HEIGHT, floor)
     map.add_object(player)
     generator.generate(map, player, **kargs)
     map.fov_recompute(player)
-    # unexplored areas start black (which is the default background color)
-    libtcod.console_set_default_background(panel, color_black)
-    libtcod.console_clear(con)
+    if con is not None:
+        # unexplored areas start black (which is the default background color)
+        libtcod.console_set_default_background(panel, color_black)
+        libtcod.console_clear(con)
 
 
 def handle_keys():
@@ -107,8 +132,8 @@ def handle_keys():
             # test for other keys
             if key_char == 'g':
                 # pick up an item
-                for object in map._objects:  # look for an item in the player's tile
-                    if object.x == player.x and object.y == player.y and object.item:
+                for object in map.objects_at(player.x, player.y):  # look for an item in the player's tile
+                    if object.item:
                         object.item.pick_up(map, player)
                         play_sound('Pickup.wav')
                         break
@@ -116,8 +141,8 @@ def handle_keys():
             # test for other keys
             if key_char == '<':
                 # pick up an item
-                for object in map._objects:  # look for an item in the player's tile
-                    if object.x == player.x and object.y == player.y and object.ladder:
+                for object in map.objects_at(player.x, player.y):  # look for a ladder in the player's tile
+                    if object.ladder:
                         make_map(floor=map.floor+1, start_x=player.x, start_y=player.y)
                         break
 
@@ -148,31 +173,32 @@ def menu(header, options, width):
         header_height = 0
     height = len(options) + header_height
     # create an off-screen console that represents the menu's window
-    window = libtcod.console_new(width, height)
-
-    # print the header, with auto-wrap
-    libtcod.console_set_default_foreground(window, libtcod.white)
-    libtcod.console_print_rect_ex(
-        window, 0, 0, width, height, libtcod.BKGND_NONE, libtcod.LEFT, header)
-    # print all the options
-    y = header_height
-    letter_index = ord('a')
-    for option_text in options:
-        text = '(' + chr(letter_index) + ') ' + option_text
-        libtcod.console_print_ex(
-            window, 0, y, libtcod.BKGND_NONE, libtcod.LEFT, text)
-        y += 1
-        letter_index += 1
-    # blit the contents of "window" to the root console
-    x = SCREEN_WIDTH/2 - width/2
-    y = SCREEN_HEIGHT/2 - height/2
-    libtcod.console_blit(window, 0, 0, width, height, 0, x, y, 1.0, 0.7)
+    with Console(width, height) as window:
+        # print the header, with auto-wrap
+        libtcod.console_set_default_foreground(window.handle, libtcod.white)
+        libtcod.console_print_rect_ex(
+            window.handle, 0, 0, width, height, libtcod.BKGND_NONE, libtcod.LEFT, header)
+        # print all the options
+        y = header_height
+        letter_index = ord('a')
+        for option_text in options:
+            text = '(' + chr(letter_index) + ') ' + option_text
+            libtcod.console_print_ex(
+                window.handle, 0, y, libtcod.BKGND_NONE, libtcod.LEFT, text)
+            y += 1
+            letter_index += 1
+        # blit the contents of "window" to the root console
+        x = SCREEN_WIDTH/2 - width/2
+        y = SCREEN_HEIGHT/2 - height/2
+        libtcod.console_blit(window.handle, 0, 0, width, height, 0, x, y, 1.0, 0.7)
     # present the root console to the player and wait for a key-press
     libtcod.console_flush()
     key = libtcod.console_wait_for_keypress(True)
     # (special case) Alt+Enter: toggle fullscreen
     if key.vk == libtcod.KEY_ENTER and key.lalt:
         libtcod.console_set_fullscreen(not libtcod.console_is_fullscreen())
+    # the menu was drawn over the game, so it has to be redrawn
+    invalidate_screen()
     # convert the ASCII code to an index; if it corresponds to an option, return it
     index = key.c - ord('a')
     if index >= 0 and index < len(options):
@@ -202,10 +228,34 @@ def inventory_menu(header):
     except IndexError:
         return None
 
+def invalidate_screen():
+    # force the next render_all to redraw everything, e.g. after a menu was
+    # drawn on top of the game
+    global panel_drawn
+    panel_drawn = None
+    if map is not None:
+        map.invalidate_drawing()
+
+
 def render_all():
-    libtcod.console_clear(0)
-    map.draw(con, player)
-    libtcod.console_blit(con, player.x-SCREEN_WIDTH/2, player.y-PANEL_Y/2, SCREEN_WIDTH, PANEL_Y, 0, 0, 0)
+    global panel_drawn
+
+    drawn = map.draw(con, player)
+    if drawn == 'all':
+        # the view moved, start again from a clean screen
+        libtcod.console_clear(0)
+        panel_drawn = None
+    if drawn is not None:
+        libtcod.console_blit(con, player.x-SCREEN_WIDTH/2, player.y-PANEL_Y/2, SCREEN_WIDTH, PANEL_Y, 0, 0, 0)
+
+    # only redraw the GUI panel if something it shows changed
+    names = get_names_under_mouse()
+    weapon = player.fighter.weapon.name
+    panel_state = (tuple(game_msgs), player.fighter.hp, player.fighter.max_hp,
+                   player.fighter.xp, weapon, map.floor, names)
+    if panel_state == panel_drawn:
+        return
+    panel_drawn = panel_state
 
     # prepare to render the GUI panel
     libtcod.console_set_default_background(panel, color_black)
@@ -229,14 +279,14 @@ def render_all():
     libtcod.console_print_ex(
         panel, 1, 3, libtcod.BKGND_NONE, libtcod.LEFT, str.capitalize(player.display_name()))
     libtcod.console_print_ex(
-        panel, 1, 4, libtcod.BKGND_NONE, libtcod.LEFT, 'Weapon: ' + player.fighter.weapon.name)
+        panel, 1, 4, libtcod.BKGND_NONE, libtcod.LEFT, 'Weapon: ' + weapon)
     libtcod.console_print_ex(
         panel, 1, 5, libtcod.BKGND_NONE, libtcod.LEFT, 'Floor ' + str(map.floor))
 
     # display names of objects under the mouse
     libtcod.console_set_default_foreground(panel, libtcod.light_gray)
     libtcod.console_print_ex(
-        panel, 1, 0, libtcod.BKGND_NONE, libtcod.LEFT, get_names_under_mouse())
+        panel, 1, 0, libtcod.BKGND_NONE, libtcod.LEFT, names)
 
     # blit the contents of "panel" to the root console
     libtcod.console_blit(panel, 0, 0, SCREEN_WIDTH,
@@ -249,8 +299,8 @@ def get_names_under_mouse():
     # return a string with the names of all objects under the mouse
     (x, y) = (mouse.cx, mouse.cy)
     # create a list with the names of all objects at the mouse's coordinates and in FOV
-    names = [obj.display_name() for obj in map._objects
-             if obj.x == x and obj.y == y and libtcod.map_is_in_fov(map.fov_map, obj.x, obj.y)]
+    names = [obj.display_name() for obj in map.objects_at(x, y)
+             if obj.is_visible()]
     names = ', '.join(names)  # join the names, separated by commas
     return names.capitalize()
 
@@ -279,6 +329,7 @@ def render_bar(x, y, total_width, name, value, maximum, bar_color, back_color, m
 # Give player some torches
 
 
+@callback
 def light_torch():
     map.torch_left = 100
 
@@ -303,53 +354,47 @@ def play_game():
             libtcod.EVENT_KEY_PRESS | libtcod.EVENT_MOUSE, key, mouse)
         render_all()
         libtcod.console_flush()
+        sounds.new_frame()
 
         # handle keys and exit game if needed
-        for object in map._objects:
-            object.clear(con)
         player_action = handle_keys()
-        # let monsters take their turn
-        if game_state == 'playing' and player_action != 'didnt-take-turn':
-            for object in map._objects:
-                if object != player and object.ai != None:
-                    object.ai.take_turn(map, player)
-            # deplete torch
-            if map.torch_left > 0:
-                map.torch_left -= 1
-                if map.torch_left == 0:
-                    message('Your torch burned out', libtcod.orange)
+        process_turn(player_action)
         if player_action == 'exit':
             track('Exited Game')
             if player.fighter.hp > 0:
                 save_game()
             break
+        if game_state == 'playing' and player_action != 'didnt-take-turn':
+            autosaver.turn(map, player, game_msgs, game_state)
+        if autosaver.error is not None:
+            message('Autosave failed: ' + str(autosaver.error), libtcod.red)
+            autosaver.error = None
+
+
+def process_turn(player_action):
+    # let monsters take their turn
+    if game_state == 'playing' and player_action != 'didnt-take-turn':
+        map.take_monster_turns(player)
+        # deplete torch
+        if map.torch_left > 0:
+            map.torch_left -= 1
+            if map.torch_left == 0:
+                message('Your torch burned out', libtcod.orange)
 
 
 def save_game():
-    global map
-    file = open('savegame', 'wb')
-    data = {}
-    data['map'] = map
-    data['player_index'] = map._objects.index(player)
-    data['game_msgs'] = game_msgs
-    data['game_state'] = game_state
-    dill.dump(data, file)
-    file.close()
+    autosaver.save(map, player, game_msgs, game_state)
 
 
 def load_game():
     global map, player, game_msgs, game_state
-    file = open('savegame', 'rb')
-    data = dill.load(file)
-    file.close()
-    map = data['map']
-    player = map._objects[data['player_index']]
-    game_msgs[:] = data['game_msgs']
-    game_state = data['game_state']
-
-    # Reset FOV after loading game
-    map.fov_map = libtcod.map_new(map.w, map.h)
-    map.set_fov()
+    autosaver.flush()
+    if map is not None:
+        map.release()
+    (map, player, msgs, game_state) = savegame.load('savegame')
+    game_msgs[:] = msgs
+
+    # Rebuild FOV after loading game
     map.fov_recompute(player)
     track('Loaded Game')
 
@@ -387,5 +432,15 @@ def main_menu():
             break
 
 
-init_tracking(menu)
-main_menu()
+def main():
+    init_console()
+    init_tracking(menu)
+    try:
+        main_menu()
+    finally:
+        autosaver.close()
+        stop_tracking()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,70 @@
 from pygame import mixer
 
-mixer.init()
+# turned off when the game runs without a display or audio device
+enabled = True
+
+# the sound effects of the game, loaded once by preload
+EFFECTS = ['Bosscollapse.wav', 'Confuse.wav', 'Dead.wav', 'Heal.wav', 'Levelup.wav',
+           'Monsterkill.wav', 'Pickup.wav', 'Select.wav', 'Slash.wav', 'Spellcast.wav',
+           'Spellexplosion.wav', 'hurt.wav', 'miss.wav', 'wrong.wav']
+
+# how many effects can play at once. when they are all busy, the one that
+# has played longest is cut off
+CHANNELS = 8
+
+
+class SoundBank(object):
+    # effects decoded once into mixer.Sound objects, played on a pool of
+    # channels so they don't cut each other off. the same effect is only
+    # played once per frame: ten monsters missing at once sound like one
+    def __init__(self, channels=CHANNELS):
+        self.channels = channels
+        self.sounds = {}
+        self.played = set()
+
+    def init(self):
+        if not mixer.get_init():
+            mixer.init()
+        mixer.set_num_channels(self.channels)
+
+    def preload(self, soundfiles=EFFECTS):
+        self.init()
+        for soundfile in soundfiles:
+            self.sound(soundfile)
+
+    def sound(self, soundfile):
+        sound = self.sounds.get(soundfile)
+        if sound is None:
+            sound = self.sounds[soundfile] = mixer.Sound(soundfile)
+        return sound
+
+    def play(self, soundfile):
+        if soundfile in self.played:
+            return
+        self.played.add(soundfile)
+        if not mixer.get_init():
+            self.init()
+        channel = mixer.find_channel(True)
+        if channel is not None:
+            channel.play(self.sound(soundfile))
+
+    def new_frame(self):
+        self.played.clear()
+
+
+bank = SoundBank()
+
+
+def preload():
+    if enabled:
+        bank.preload()
+
+
+def new_frame():
+    bank.new_frame()
+
 
 def play_sound(soundfile):
-    mixer.music.load(open(soundfile))
-    mixer.music.play()
\ No newline at end of file
+    if not enabled:
+        return
+    bank.play(soundfile)
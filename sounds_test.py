@@ -0,0 +1,75 @@
+import unittest
+import sounds
+from sounds import SoundBank
+
+
+class FakeChannel(object):
+    def __init__(self, mixer):
+        self.mixer = mixer
+
+    def play(self, sound):
+        self.mixer.played.append(sound.soundfile)
+
+
+class FakeSound(object):
+    def __init__(self, mixer, soundfile):
+        self.soundfile = soundfile
+        mixer.loaded.append(soundfile)
+
+
+class FakeMixer(object):
+    # records what the bank loads and plays instead of making noise
+    def __init__(self):
+        self.loaded = []
+        self.played = []
+        self.initialized = False
+
+    def get_init(self):
+        return self.initialized
+
+    def init(self):
+        self.initialized = True
+
+    def set_num_channels(self, n):
+        self.channels = n
+
+    def Sound(self, soundfile):
+        return FakeSound(self, soundfile)
+
+    def find_channel(self, force=False):
+        return FakeChannel(self)
+
+
+class TestSoundBank(unittest.TestCase):
+
+    def setUp(self):
+        self.real_mixer = sounds.mixer
+        self.mixer = sounds.mixer = FakeMixer()
+
+    def tearDown(self):
+        sounds.mixer = self.real_mixer
+
+    def test_sounds_are_loaded_once(self):
+        bank = SoundBank()
+        for _ in range(3):
+            bank.play('hurt.wav')
+            bank.new_frame()
+        self.assertEqual(self.mixer.loaded, ['hurt.wav'])
+        self.assertEqual(self.mixer.played, ['hurt.wav'] * 3)
+        self.assertEqual(self.mixer.channels, sounds.CHANNELS)
+
+    def test_one_of_each_sound_per_frame(self):
+        bank = SoundBank()
+        for soundfile in ['miss.wav', 'miss.wav', 'hurt.wav', 'miss.wav']:
+            bank.play(soundfile)
+        self.assertEqual(self.mixer.played, ['miss.wav', 'hurt.wav'])
+        bank.new_frame()
+        bank.play('miss.wav')
+        self.assertEqual(self.mixer.played, ['miss.wav', 'hurt.wav', 'miss.wav'])
+
+    def test_preload(self):
+        SoundBank().preload()
+        self.assertEqual(self.mixer.loaded, sounds.EFFECTS)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import libtcodpy as libtcod
+from object import Object
+from components import Fighter, BasicMonster, Item
+
+# every kind of object, by id
+TEMPLATES = {}
+
+
+def register(template):
+    if template.id in TEMPLATES:
+        raise ValueError('Template ' + template.id + ' is already registered.')
+    TEMPLATES[template.id] = template
+    return template
+
+
+# the functions components call (death functions, item uses...), by name.
+# saves refer to them by these names
+CALLBACKS = {}
+
+
+def callback(function):
+    if function.__name__ in CALLBACKS:
+        raise ValueError('Callback ' + function.__name__ + ' is already registered.')
+    CALLBACKS[function.__name__] = function
+    return function
+
+
+class Template:
+    # the data that all objects of one kind share: name, glyph, color and
+    # whatever their components need. objects point back to their template
+    # and only keep their own position and mutable state
+    def __init__(self, id, name, char, color=libtcod.white, blocks=False):
+        self.id = id
+        self.name = name
+        self.char = char
+        self.color = color
+        self.blocks = blocks
+
+    def spawn(self, x, y, **components):
+        return Object(x, y, self.char, self.name, self.color,
+                      blocks=self.blocks, kind=self, **components)
+
+
+class MonsterTemplate(Template):
+    def __init__(self, id, name, char, stats, atk_range=2, color=libtcod.white):
+        Template.__init__(self, id, name, char, color, blocks=True)
+        # shared by every Fighter of this kind
+        self.stats = stats
+        self.atk_range = atk_range
+
+    def spawn(self, x, y, xp=0):
+        fighter_component = Fighter(xp=xp, stats=self.stats)
+        ai_component = BasicMonster(atk_range=self.atk_range)
+        return Template.spawn(self, x, y, fighter=fighter_component, ai=ai_component)
+
+
+class ItemTemplate(Template):
+    def __init__(self, id, name, char, use_function, color=libtcod.white):
+        Template.__init__(self, id, name, char, color)
+        self.use_function = use_function
+
+    def spawn(self, x, y):
+        item_component = Item(use_function=self.use_function)
+        return Template.spawn(self, x, y, item=item_component)
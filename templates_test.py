@@ -0,0 +1,29 @@
+import unittest
+from templates import TEMPLATES
+from dungeon_generator import ORC, HEALING_POTION
+
+class TestTemplates(unittest.TestCase):
+
+    def test_registry(self):
+        self.assertIs(TEMPLATES['orc'], ORC)
+        self.assertIs(TEMPLATES['healing_potion'], HEALING_POTION)
+
+    def test_monsters_share_stats(self):
+        a = ORC.spawn(1, 1, xp=0)
+        b = ORC.spawn(2, 2, xp=100)
+        self.assertIs(a.fighter.stats, b.fighter.stats)
+        self.assertIs(a.kind, ORC)
+        self.assertTrue(a.blocks)
+        # but each keeps its own state
+        self.assertEqual(b.fighter.level(), 2)
+        a.fighter.hp -= 5
+        self.assertNotEqual(a.fighter.hp, b.fighter.hp)
+
+    def test_items(self):
+        potion = HEALING_POTION.spawn(3, 4)
+        self.assertEqual((potion.x, potion.y), (3, 4))
+        self.assertEqual(potion.name, 'healing potion')
+        self.assertIs(potion.item.use_function, HEALING_POTION.use_function)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+from array import array
+
+
+class Tile(object):
+    # a view of one cell of a TileGrid. it behaves like the old per-cell tile
+    # object, but reads and writes go straight to the grid's planes.
+    __slots__ = ('grid', 'index')
+
+    def __init__(self, grid, index):
+        self.grid = grid
+        self.index = index
+
+    @property
+    def blocked(self):
+        return bool(self.grid.blocked[self.index])
+
+    @blocked.setter
+    def blocked(self, value):
+        self.grid.blocked[self.index] = 1 if value else 0
+        self.grid.changed.add(self.index)
+
+    @property
+    def block_sight(self):
+        return bool(self.grid.block_sight[self.index])
+
+    @block_sight.setter
+    def block_sight(self, value):
+        self.grid.block_sight[self.index] = 1 if value else 0
+        self.grid.changed.add(self.index)
+
+    @property
+    def explored(self):
+        return bool(self.grid.explored[self.index])
+
+    @explored.setter
+    def explored(self, value):
+        self.grid.explored[self.index] = 1 if value else 0
+
+    @property
+    def tunnel(self):
+        return bool(self.grid.tunnel[self.index])
+
+    @tunnel.setter
+    def tunnel(self, value):
+        self.grid.tunnel[self.index] = 1 if value else 0
+
+    @property
+    def xp_gain(self):
+        return self.grid.xp_gain[self.index]
+
+    @xp_gain.setter
+    def xp_gain(self, value):
+        self.grid.xp_gain[self.index] = value
+
+
+class TileColumn(object):
+    # lets old callers keep writing tiles[x][y]
+    __slots__ = ('grid', 'x')
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.x = x
+
+    def __getitem__(self, y):
+        return Tile(self.grid, self.grid.index(self.x, y))
+
+    def __len__(self):
+        return self.grid.h
+
+
+class TileGrid(object):
+    # the tiles of a map, stored as one packed plane per property.
+    # cells are laid out row by row (x + y * w), the same order libtcod's
+    # console fill functions expect.
+    def __init__(self, w, h, blocked=True):
+        self.w = w
+        self.h = h
+        n = w * h
+        fill = 1 if blocked else 0
+        self.blocked = bytearray([fill]) * n
+        # by default, if a tile is blocked, it also blocks sight
+        self.block_sight = bytearray([fill]) * n
+        self.explored = bytearray(n)
+        self.tunnel = bytearray(n)
+        self.xp_gain = array('H', [0]) * n
+        # cells whose blocked/block_sight changed since the last take_changes()
+        self.changed = set()
+
+    def index(self, x, y):
+        if 0 <= x < self.w and 0 <= y < self.h:
+            return x + y * self.w
+        raise IndexError('tile (%d, %d) is outside the map' % (x, y))
+
+    def __getitem__(self, x):
+        if not 0 <= x < self.w:
+            raise IndexError('column %d is outside the map' % x)
+        return TileColumn(self, x)
+
+    def __len__(self):
+        return self.w
+
+    def at(self, x, y):
+        return Tile(self, self.index(x, y))
+
+    def set_blocked(self, x, y, blocked, block_sight=None):
+        if block_sight is None:
+            block_sight = blocked
+        i = self.index(x, y)
+        self.blocked[i] = 1 if blocked else 0
+        self.block_sight[i] = 1 if block_sight else 0
+        self.changed.add(i)
+
+    def fill_rect(self, x1, y1, x2, y2, blocked):
+        # set blocked/block_sight for every cell in [x1, x2) x [y1, y2),
+        # one row slice at a time
+        x1 = max(x1, 0)
+        y1 = max(y1, 0)
+        x2 = min(x2, self.w)
+        y2 = min(y2, self.h)
+        if x1 >= x2 or y1 >= y2:
+            return
+        row = bytearray([1 if blocked else 0]) * (x2 - x1)
+        for y in range(y1, y2):
+            start = x1 + y * self.w
+            self.blocked[start:start + len(row)] = row
+            self.block_sight[start:start + len(row)] = row
+            self.changed.update(xrange(start, start + len(row)))
+
+    def carve_blocks(self, positions):
+        # carve a 2x2 block of tunnel with its top left corner at each of the
+        # given positions, all in one go. blocks are clipped to the grid
+        w = self.w
+        cells = set()
+        for (x, y) in positions:
+            if 0 <= x < w - 1 and 0 <= y < self.h - 1:
+                i = x + y * w
+                cells.update((i, i + 1, i + w, i + w + 1))
+            else:
+                for (cx, cy) in [(x, y), (x + 1, y), (x, y + 1), (x + 1, y + 1)]:
+                    if 0 <= cx < w and 0 <= cy < self.h:
+                        cells.add(cx + cy * w)
+        blocked = self.blocked
+        block_sight = self.block_sight
+        tunnel = self.tunnel
+        for i in cells:
+            blocked[i] = 0
+            block_sight[i] = 0
+            tunnel[i] = 1
+        self.changed.update(cells)
+
+    def tunnel_indexes(self):
+        i = self.tunnel.find(b'\x01')
+        while i != -1:
+            yield i
+            i = self.tunnel.find(b'\x01', i + 1)
+
+    def open_tunnels(self):
+        # make sure every carved tunnel cell is passable again, even where a
+        # room corner was placed on top of it
+        for i in self.tunnel_indexes():
+            if self.blocked[i] or self.block_sight[i]:
+                self.blocked[i] = 0
+                self.block_sight[i] = 0
+                self.changed.add(i)
+
+    def take_changes(self):
+        changed = self.changed
+        self.changed = set()
+        return changed
@@ -0,0 +1,62 @@
+import unittest
+from tile_grid import TileGrid
+
+class TestTileGrid(unittest.TestCase):
+
+    def test_starts_blocked(self):
+        grid = TileGrid(4, 3)
+        self.assertTrue(grid[2][1].blocked)
+        self.assertTrue(grid[2][1].block_sight)
+        self.assertFalse(grid[2][1].explored)
+        self.assertEqual(grid[2][1].xp_gain, 0)
+
+    def test_view_writes_to_planes(self):
+        grid = TileGrid(4, 3)
+        grid[2][1].blocked = False
+        grid[2][1].xp_gain = 20
+        self.assertEqual(grid.blocked[grid.index(2, 1)], 0)
+        self.assertEqual(grid.xp_gain[grid.index(2, 1)], 20)
+        # other cells are untouched
+        self.assertTrue(grid.at(1, 2).blocked)
+
+    def test_fill_rect_is_half_open(self):
+        grid = TileGrid(5, 5)
+        grid.fill_rect(1, 1, 3, 4, False)
+        self.assertFalse(grid.at(1, 1).blocked)
+        self.assertFalse(grid.at(2, 3).block_sight)
+        self.assertTrue(grid.at(3, 1).blocked)
+        self.assertTrue(grid.at(1, 4).blocked)
+
+    def test_fill_rect_clips_to_map(self):
+        grid = TileGrid(3, 3)
+        grid.fill_rect(-2, -2, 10, 1, False)
+        self.assertFalse(grid.at(2, 0).blocked)
+        self.assertTrue(grid.at(0, 1).blocked)
+
+    def test_out_of_range_raises_index_error(self):
+        grid = TileGrid(3, 3)
+        self.assertRaises(IndexError, grid.at, 3, 0)
+        self.assertRaises(IndexError, grid.at, -1, 0)
+        self.assertRaises(IndexError, lambda: grid[0][3])
+
+    def test_open_tunnels(self):
+        grid = TileGrid(3, 3)
+        grid.carve_blocks([(1, 1)])
+        grid.set_blocked(1, 1, True)
+        grid.open_tunnels()
+        self.assertFalse(grid.at(1, 1).blocked)
+        self.assertEqual(list(grid.tunnel_indexes()),
+                         [grid.index(1, 1), grid.index(2, 1), grid.index(1, 2), grid.index(2, 2)])
+
+    def test_carve_blocks(self):
+        grid = TileGrid(4, 3)
+        grid.take_changes()
+        # the second block sticks out of the grid and is clipped
+        grid.carve_blocks([(0, 0), (3, 2)])
+        open_cells = [(x, y) for y in range(3) for x in range(4) if not grid.at(x, y).blocked]
+        self.assertEqual(open_cells, [(0, 0), (1, 0), (0, 1), (1, 1), (3, 2)])
+        self.assertTrue(grid.at(3, 2).tunnel)
+        self.assertEqual(len(grid.take_changes()), 5)
+
+if __name__ == '__main__':
+    unittest.main()